@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+Batch feature extraction over a folder/plate of acquisitions.
+
+@author: coylelab @ UW-Madison
+"""
+
+import glob
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import torch
+
+from ._io import IMAGE_EXTENSIONS, read_image, write_to_zarr
+from ._memory import available_memory
+from ._tiling import progress_info
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRESET_MODES = ("fft", "cwt")
+MANIFEST_NAME = "manifest.json"
+
+
+def load_preset(path):
+    with open(path) as f:
+        preset = json.load(f)
+    if preset.get("mode") not in PRESET_MODES:
+        raise ValueError(f"Preset {path} must have a 'mode' of {PRESET_MODES}")
+    preset.setdefault("params", {})
+    return preset
+
+
+def check_batch_preset(preset):
+    """Reject preset options that need per-file inputs a batch run does not have."""
+    if preset["mode"] == "cwt" and preset["params"].get("sparse", "off") != "off":
+        raise ValueError("Sparse CWT needs a per-file mask, which batch runs do not provide; "
+                         "set 'sparse' to 'off' in the preset")
+
+
+def save_preset(preset, path):
+    with open(path, "w") as f:
+        json.dump(preset, f, indent=2, default=str)
+
+
+def find_inputs(source):
+    """Sorted image files in a folder, or matching a glob pattern."""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+    else:
+        paths = glob.glob(os.path.expanduser(source), recursive=True)
+    return sorted(
+        os.path.abspath(p) for p in paths
+        if os.path.isfile(p) and p.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+    )
+
+
+def output_path_for(input_path, output_dir, mode):
+    name = os.path.basename(input_path).rsplit('.', 1)[0]
+    return os.path.join(output_dir, f"{name}_{mode}.zarr")
+
+
+class BatchManifest:
+    """JSON record of a batch run: the preset and the status of each input.
+
+    Written atomically after every update, so it is consistent even if the
+    run is killed.
+    """
+
+    def __init__(self, path, preset):
+        self.path = path
+        self.files = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get("preset") != json.loads(json.dumps(preset, default=str)):
+                raise ValueError(
+                    f"{path} was written with a different preset; use a new output folder "
+                    "or delete the manifest to recompute"
+                )
+            self.files = saved.get("files", {})
+        self.preset = preset
+
+    def is_done(self, input_path):
+        entry = self.files.get(input_path)
+        return entry is not None and entry["status"] == "done" and os.path.exists(entry["output"])
+
+    def record(self, input_path, output, status, **info):
+        self.files[input_path] = dict(output=output, status=status, **info)
+        self.save()
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"preset": self.preset, "files": self.files}, f, indent=2, default=str)
+        os.replace(tmp, self.path)
+
+
+def process_file(input_path, output_path, preset, memory_budget=None):
+    """Compute one input's features into `output_path`; returns its pixel count.
+
+    Results are written to a temporary store that is renamed into place only
+    once complete, so a killed run never leaves a half-written output that
+    looks finished.
+    """
+    from ._features import fft_job, cwt_job
+    
+    params = dict(preset["params"])
+    lazy = params.pop("lazy", True)
+    params.pop("zarr_path", None)
+    image, name = read_image(input_path, lazy=lazy)
+    if "blocks" not in params:
+        params["auto_blocks"] = True  # explicit block counts from the preset are kept
+    if memory_budget is not None:
+        if not lazy:
+            memory_budget = max(memory_budget - image.nbytes, memory_budget // 4)
+    partial_path = output_path + ".partial"
+    if os.path.exists(partial_path):
+        shutil.rmtree(partial_path)
+    
+    if preset["mode"] == "fft":
+        stream = params.get("stream_to_zarr", False)
+        job = fft_job(image, zarr_path=partial_path, memory_budget=memory_budget, **params)
+    else:
+        stream = False
+        job = cwt_job(image, memory_budget=memory_budget, **params)
+    
+    while True:
+        try:
+            next(job)
+        except StopIteration as stop:
+            result = stop.value
+            break
+    if not stream:
+        write_to_zarr(result, partial_path)
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    os.replace(partial_path, output_path)
+    return image.shape[-2] * image.shape[-1]
+
+
+def run_batch(inputs, output_dir, preset, jobs=1, memory_budget=None, manifest_path=None):
+    """Generator processing `inputs` with `preset`; yields progress per finished file and returns {input: status}.
+
+    Files marked done in the manifest are skipped; up to `jobs` files run in
+    separate processes, sharing `memory_budget` bytes for their block plans.
+    """
+    check_batch_preset(preset)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = BatchManifest(manifest_path or os.path.join(output_dir, MANIFEST_NAME), preset)
+    mode = preset["mode"]
+    params = preset["params"]
+    
+    pending = [p for p in inputs if not manifest.is_done(p)]
+    skipped = len(inputs) - len(pending)
+    if skipped:
+        logger.info(f"Resuming: {skipped} of {len(inputs)} file(s) already done")
+    
+    use_gpu = params.get("use_gpu", False)
+    if jobs > 1 and use_gpu:
+        logger.info("Concurrent batch jobs are CPU-only; processing files one at a time on the GPU...")
+        jobs = 1
+    if jobs > 1 and params.get("workers", 1) > 1:
+        logger.info("Running files concurrently; CWT blocks within each file run in one process")
+        preset = dict(preset, params=dict(params, workers=1))
+    if memory_budget is None:
+        device = torch.device("cuda") if use_gpu and torch.cuda.is_available() else torch.device("cpu")
+        memory_budget = available_memory(device) * (1 - params.get("memory_headroom", 0.25))
+    share = int(memory_budget // jobs)
+    
+    total = len(pending)
+    status = {p: "done" for p in inputs if p not in pending}
+    pixels_done = 0
+    start = time.time()
+    
+    def finish(input_path, output, started, future_or_exc):
+        nonlocal pixels_done
+        try:
+            pixels_done += future_or_exc() if callable(future_or_exc) else 0
+            manifest.record(input_path, output, "done", seconds=round(time.time() - started, 1))
+            status[input_path] = "done"
+        except Exception as e:
+            logger.error(f"Failed on {input_path}: {e}")
+            manifest.record(input_path, output, "failed", error=str(e))
+            status[input_path] = "failed"
+    
+    if jobs <= 1:
+        for i, input_path in enumerate(pending):
+            output = output_path_for(input_path, output_dir, mode)
+            logger.info(f"[{i + 1}/{total}] {input_path} -> {output}")
+            started = time.time()
+            finish(input_path, output, started,
+                   lambda: process_file(input_path, output, preset, share))
+            info = progress_info(i + 1, total, pixels_done, start)
+            info.update(unit="file", file=input_path)
+            yield info
+        return status
+    
+    executor = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn"))
+    futures = {}
+    try:
+        for input_path in pending:
+            output = output_path_for(input_path, output_dir, mode)
+            future = executor.submit(process_file, input_path, output, preset, share)
+            futures[future] = (input_path, output, time.time())
+        
+        done_count = 0
+        not_done = set(futures)
+        while not_done:
+            done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+            for future in done:
+                input_path, output, started = futures[future]
+                finish(input_path, output, started, future.result)
+                done_count += 1
+                logger.info(f"[{done_count}/{total}] {input_path}: {status[input_path]}")
+                info = progress_info(done_count, total, pixels_done, start)
+                info.update(unit="file", file=input_path)
+                yield info
+    finally:
+        # on cancel, drop queued files; running ones finish but are not recorded
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=True)
+    return status
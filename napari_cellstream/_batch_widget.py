@@ -0,0 +1,67 @@
+from magicgui import magicgui
+from pathlib import Path
+
+import os
+
+from ._batch import find_inputs, load_preset, save_preset, run_batch
+from ._fft_widget import fft_gui_widget
+from ._cwt_widget import generate_cwt_features_widget
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRESET_SOURCES = ["FFT widget", "CWT widget", "Preset file"]
+
+
+def preset_from_widget(gui, mode):
+    """{"mode", "params"} preset from the current values of the FFT/CWT widget."""
+    params = {
+        name: getattr(gui, name).value
+        for name in gui.__signature__.parameters
+        # per-file output, layers, mask-only and display options do not carry over to other files
+        if name not in ("zarr_path", "roi_layer", "mask_background", "sparse", "keep_on_gpu")
+    }
+    return {"mode": mode, "params": params}
+
+
+@magicgui(
+    call_button="Run batch",
+    output_dir={"mode": "d"},
+    preset_source={"choices": PRESET_SOURCES},
+    preset_file={"filter": "*.json"},
+    jobs={"min": 1, "max": os.cpu_count() or 1},
+    memory_budget_gb={"min": 0.0, "max": 4096.0, "step": 1.0},
+)
+def batch_gui_widget(
+    source: str = "",
+    output_dir: Path = Path("."),
+    preset_source: str = "CWT widget",
+    preset_file: Path = Path("preset.json"),
+    jobs: int = 1,
+    memory_budget_gb: float = 0.0,
+):
+    """Apply an FFT/CWT preset to every .nd2/.tif in a folder (or glob) -- one Zarr per file.
+
+    A manifest in `output_dir` records finished files, so re-running resumes.
+    memory_budget_gb = 0 shares the free memory between the jobs.
+    """
+    if preset_source == "FFT widget":
+        preset = preset_from_widget(fft_gui_widget, "fft")
+    elif preset_source == "CWT widget":
+        preset = preset_from_widget(generate_cwt_features_widget, "cwt")
+    else:
+        preset = load_preset(preset_file)
+    
+    inputs = find_inputs(source)
+    if not inputs:
+        raise ValueError(f"No .nd2/.tif/.tiff files found in {source!r}")
+    
+    os.makedirs(output_dir, exist_ok=True)
+    if preset_source != "Preset file":
+        # keep the preset next to the outputs so the run can be repeated headless
+        save_preset(preset, os.path.join(output_dir, "preset.json"))
+    
+    logger.info(f"Batch: {len(inputs)} file(s) with the {preset['mode']} preset -> {output_dir}")
+    budget = int(memory_budget_gb * 1024**3) if memory_budget_gb > 0 else None
+    return run_batch(inputs, str(output_dir), preset, jobs=jobs, memory_budget=budget)
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Headless command line interface: FFT/CWT feature extraction without a viewer.
+
+    napari-cellstream features --fft in.nd2 out.zarr
+    napari-cellstream features --cwt --blocks auto --workers 4 in.tif out.zarr
+    napari-cellstream batch plate01/ plate01_features/ --preset cwt.json --jobs 4
+
+@author: coylelab @ UW-Madison
+"""
+
+import argparse
+import sys
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _blocks_arg(value):
+    if value == "auto":
+        return value
+    try:
+        blocks = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected an integer or 'auto', got {value!r}")
+    if blocks < 1:
+        raise argparse.ArgumentTypeError("blocks must be >= 1")
+    return blocks
+
+
+def _wavelet_param_arg(value):
+    key, sep, val = value.partition("=")
+    if not sep or not key:
+        raise argparse.ArgumentTypeError(f"expected key=value, got {value!r}")
+    try:
+        return key, float(val)
+    except ValueError:
+        return key, val
+
+
+def _add_bool_flag(parser, name, default, help):
+    dest = name.replace("-", "_")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(f"--{name}", dest=dest, action="store_true", help=help)
+    group.add_argument(f"--no-{name}", dest=dest, action="store_false")
+    parser.set_defaults(**{dest: default})
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="napari-cellstream",
+        description="Cellstream spectral feature extraction without the napari GUI.",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log debug messages")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    features = subparsers.add_parser(
+        "features",
+        help="Compute FFT or CWT features of an ND2/TIFF time-lapse and write them to Zarr",
+    )
+    features.add_argument("input", help="Input .nd2/.tif/.tiff image, (T, C, X, Y) or (T, X, Y)")
+    features.add_argument("output", help="Output .zarr path")
+    mode = features.add_mutually_exclusive_group(required=True)
+    mode.add_argument("--fft", dest="mode", action="store_const", const="fft", help="FFT features")
+    mode.add_argument("--cwt", dest="mode", action="store_const", const="cwt", help="CWT features")
+
+    common = features.add_argument_group("common options")
+    common.add_argument("--lazy", action="store_true",
+                        help="Keep the image on disk and read it block by block")
+    common.add_argument("--use-gpu", action="store_true", help="Use CUDA/MPS if available")
+    common.add_argument("--blocks", type=_blocks_arg, default=None,
+                        help="Number of row blocks, or 'auto' to size them from free memory "
+                             "(default: 1 for FFT, 50 for CWT)")
+    common.add_argument("--memory-headroom", type=float, default=0.25,
+                        help="Fraction of free memory kept in reserve by --blocks auto")
+    common.add_argument("--downsample-by", type=float, default=1.0)
+    common.add_argument("--time-start", type=int, default=0, help="First frame to use")
+    common.add_argument("--time-stop", type=int, default=0, help="Frame to stop before (0 = last)")
+    common.add_argument("--mask", metavar="PATH",
+                        help="Labels/binary mask (.tif/.npy, X x Y) restricting the computation")
+    _add_bool_flag(common, "mask-background", True,
+                   "Skip and zero pixels outside the mask, not just outside its bounding box (default)")
+    common.add_argument("--chunks", choices=("spatial", "pixel"), default="spatial",
+                        help="Zarr chunk layout: (T, 1, tile, tile) for browsing or "
+                             "(T, 1, k, k) for per-pixel time-series reads")
+    common.add_argument("--compression-level", type=int, default=5, choices=range(10), metavar="0-9",
+                        help="Blosc zstd level (0 = uncompressed)")
+    _add_bool_flag(common, "normalize-histogram", True, "Histogram-normalize the features (default)")
+    _add_bool_flag(common, "amplitude", True, "Return amplitude (default)")
+    _add_bool_flag(common, "phase", False, "Return phase")
+    _add_bool_flag(common, "z-score", True, "Return z-score (default)")
+
+    fft = features.add_argument_group("FFT options")
+    fft.add_argument("--max-bin", type=int, default=128)
+    _add_bool_flag(fft, "norm-amp", False, "Return normalized amplitude")
+    fft.add_argument("--stream", action="store_true",
+                     help="Write features tile by tile straight into the output store")
+    fft.add_argument("--tile-size", type=int, default=256)
+
+    cwt = features.add_argument_group("CWT options")
+    cwt.add_argument("--min-scale", type=int, default=80)
+    cwt.add_argument("--max-scale", type=int, default=180)
+    cwt.add_argument("--num-filter-banks", type=int, default=1)
+    cwt.add_argument("--carrier-channel", type=int, default=0)
+    cwt.add_argument("--bank-method", default="max_pool")
+    cwt.add_argument("--normalize-amplitudes", action="store_true")
+    cwt.add_argument("--mean-center", action="store_true")
+    _add_bool_flag(cwt, "scales", True, "Return dominant scale (default)")
+    cwt.add_argument("--wavelet", default="gmw")
+    cwt.add_argument("--wavelet-param", type=_wavelet_param_arg, action="append", default=[],
+                     metavar="KEY=VALUE", help="Wavelet parameter, e.g. --wavelet-param gamma=3")
+    cwt.add_argument("--nv", type=int, default=32, help="Voices per octave")
+    cwt.add_argument("--workers", type=int, default=1,
+                     help="CPU worker processes for CWT blocks")
+    cwt.add_argument("--sparse", choices=("off", "scatter", "table"), default="off",
+                     help="With --mask, transform only the foreground pixels and scatter the "
+                          "features back into an image or keep a per-pixel table")
+    features.add_argument("--save-preset", metavar="PATH",
+                          help="Also save these options as a JSON preset for 'batch'")
+    features.set_defaults(func=run_features)
+
+    batch = subparsers.add_parser(
+        "batch",
+        help="Apply a saved FFT/CWT preset to every image in a folder or glob, resumably",
+    )
+    batch.add_argument("source", help="Folder of .nd2/.tif/.tiff files, or a glob pattern (quote it)")
+    batch.add_argument("output_dir", help="Folder for the <name>_<mode>.zarr outputs and the manifest")
+    batch.add_argument("--preset", required=True,
+                       help="JSON preset, e.g. written by 'features --save-preset' or the batch panel")
+    batch.add_argument("--jobs", type=int, default=1, help="Files processed concurrently")
+    batch.add_argument("--memory-budget", type=float, default=None, metavar="GIB",
+                       help="Memory shared by the concurrent jobs (default: free memory)")
+    batch.add_argument("--manifest", default=None,
+                       help="Manifest path (default: OUTPUT_DIR/manifest.json)")
+    batch.set_defaults(func=run_batch_command)
+    return parser
+
+
+def _print_progress(info):
+    if "plan" in info:
+        return  # the auto block plan is logged when the job starts
+    print(
+        f"\r{info.get('unit', 'block')} {info['done']}/{info['total']} - "
+        f"{info['pixels_per_s']:,.0f} px/s - ETA {info['eta']:.0f} s",
+        end="\n" if info.get("unit") == "file" else "", flush=True,
+    )
+
+
+def _run_job(job):
+    """Exhaust a feature job, printing its progress; returns the job result."""
+    while True:
+        try:
+            info = next(job)
+        except StopIteration as stop:
+            print()
+            return stop.value
+        _print_progress(info)
+
+
+def preset_from_args(args):
+    """{"mode", "params"} preset from the features options, in widget parameter names."""
+    params = dict(
+        lazy=args.lazy,
+        use_gpu=args.use_gpu,
+        memory_headroom=args.memory_headroom,
+        downsample_by=args.downsample_by,
+        normalize_histogram=args.normalize_histogram,
+        return_amplitude=args.amplitude,
+        return_phase=args.phase,
+        return_z_score=args.z_score,
+        time_start=args.time_start,
+        time_stop=args.time_stop,
+        mask_background=args.mask_background,
+    )
+    if args.blocks == "auto":
+        params["auto_blocks"] = True
+    elif args.blocks is not None:
+        params["blocks"] = args.blocks
+    
+    if args.mode == "fft":
+        params.update(
+            max_bin=args.max_bin,
+            return_norm_amp=args.norm_amp,
+            stream_to_zarr=args.stream,
+            tile_size=args.tile_size,
+        )
+    else:
+        params.update(
+            min_scale=args.min_scale,
+            max_scale=args.max_scale,
+            num_filter_banks=args.num_filter_banks,
+            carrier_channel=args.carrier_channel,
+            bank_method=args.bank_method,
+            normalize_amplitudes=args.normalize_amplitudes,
+            mean_center=args.mean_center,
+            return_scales=args.scales,
+            wavelet_choice=args.wavelet,
+            wavelet_parameters=dict(args.wavelet_param) if args.wavelet_param else None,
+            nv=args.nv,
+            workers=args.workers,
+            sparse=args.sparse,
+        )
+    return {"mode": args.mode, "params": params}
+
+
+def run_features(args):
+    from ._io import read_image, read_mask, write_to_zarr, make_compressor
+    from ._batch import save_preset
+    from ._features import fft_job, cwt_job
+
+    preset = preset_from_args(args)
+    if args.save_preset:
+        save_preset(preset, args.save_preset)
+        print(f"Saved {args.mode} preset to {args.save_preset}")
+    params = dict(preset["params"])
+    image, name = read_image(args.input, lazy=params.pop("lazy"))
+    print(f"Loaded {name}: {image.shape}")
+    if args.mask:
+        params["roi_mask"] = read_mask(args.mask, image.shape[-2:])
+
+    if args.mode == "fft":
+        job = fft_job(image, zarr_path=args.output, **params)
+    else:
+        job = cwt_job(image, **params)
+    result = _run_job(job)
+    if not params.get("stream_to_zarr", False):
+        print(f"Writing features to {args.output}...")
+        clevel = args.compression_level
+        write_to_zarr(result, args.output, chunks=args.chunks,
+                      compressor=make_compressor(clevel=clevel) if clevel > 0 else None)
+    return 0
+
+
+def run_batch_command(args):
+    from ._batch import find_inputs, load_preset, run_batch
+
+    preset = load_preset(args.preset)
+    inputs = find_inputs(args.source)
+    if not inputs:
+        raise ValueError(f"No .nd2/.tif/.tiff files found in {args.source}")
+    print(f"Processing {len(inputs)} file(s) with the {preset['mode']} preset {args.preset}")
+    budget = None if args.memory_budget is None else int(args.memory_budget * 1024**3)
+    status = _run_job(run_batch(inputs, args.output_dir, preset, jobs=args.jobs,
+                                memory_budget=budget, manifest_path=args.manifest))
+    failed = [p for p, s in status.items() if s != "done"]
+    print(f"{len(status) - len(failed)} done, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(levelname)s %(name)s: %(message)s",
+    )
+    try:
+        return args.func(args)
+    except (ValueError, OSError) as e:
+        logger.error(str(e))
+        return 1
+    except KeyboardInterrupt:
+        print()
+        logger.error("Interrupted")
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,32 @@
 from magicgui import magicgui
 from napari.types import ImageData
-from napari.layers import Image
+from napari.layers import Image, Layer
 from napari import current_viewer
 from qtpy.QtWidgets import QWidget
-import torch
 import numpy as np
 
-from cellstream.cwt.utils import generate_cwt_image_cellstreams
+import os
+from typing import Optional
+
+from ._features import cwt_job
+from ._regions import layer_mask
 
 @magicgui(
     call_button="Generate CWT Features",
     blocks={"min": 1, "max": 100000},
+    memory_headroom={"min": 0.0, "max": 0.95, "step": 0.05},
+    workers={"min": 1, "max": os.cpu_count() or 1},
     wavelet_choice={"visible": False},
     wavelet_parameters={"visible": False},
     nv={"visible": False},
+    time_start={"min": 0, "max": 1000000},
+    time_stop={"min": 0, "max": 1000000, "tooltip": "0 = last frame"},
+    roi_layer={"tooltip": "Shapes ROI or Labels mask restricting the computation (empty = full field)"},
+    mask_background={"tooltip": "Skip and zero pixels outside the ROI/mask, not just outside its bounding box"},
+    sparse={"choices": ["off", "scatter", "table"],
+            "tooltip": "Transform only the mask's foreground pixels as one batch; "
+                       "scatter back to an image or keep a per-pixel table"},
+    keep_on_gpu={"tooltip": "With use_gpu, keep the features on the GPU; only displayed slices are copied to host"},
 )
 def generate_cwt_features_widget(
     #viewer: "napari.viewer.Viewer",
@@ -23,8 +36,11 @@ def generate_cwt_features_widget(
     num_filter_banks: int = 1,
     carrier_channel: int = 0,
     blocks: int = 50,
+    auto_blocks: bool = False,
+    memory_headroom: float = 0.25,
     normalize_amplitudes: bool = False,
     use_gpu: bool = False,
+    workers: int = 1,
     bank_method: str = 'max_pool',
     downsample_by: float = 1.0,
     normalize_histogram: bool = True,
@@ -36,6 +52,12 @@ def generate_cwt_features_widget(
     wavelet_choice: str = 'gmw',
     wavelet_parameters= None,
     nv: int = 32,
+    time_start: int = 0,
+    time_stop: int = 0,
+    roi_layer: Optional[Layer] = None,
+    mask_background: bool = True,
+    sparse: str = "off",
+    keep_on_gpu: bool = False,
 ):
     
     viewer = current_viewer()
@@ -51,49 +73,34 @@ def generate_cwt_features_widget(
     if img.ndim != 4:
         print("Expected image shape (T, C, X, Y)")
         return
-    T, C, X, Y=img.shape
-
-    # Convert numpy to torch tensor
-    img_tensor = torch.from_numpy(img.astype('float32'))
-
-    #prepare channel_outputs parameter
-    channel_outputs=dict()
-    for c in range(C):
-        channel_returns=list()
-        if return_amplitude==True:
-            channel_returns.append('amp')
-        if return_scales==True:
-            channel_returns.append('freq')
-        if return_phase==True:
-            channel_returns.append('phase')
-        if return_z_score==True:
-            channel_returns.append('z_score')
-        channel_outputs[c]=channel_returns
-    
-    #prepare wavelet parameters:
-    if wavelet_parameters==None:
-        wavelet=wavelet_choice #pure string
-    else:
-        wavelet=(wavelet_choice,wavelet_parameters) # tuple
-
 
-    print(f"Running CWT blockwise feature generation with {wavelet} and {nv}...")
-    results = generate_cwt_image_cellstreams(
-        img=img_tensor,
+    return cwt_job(
+        img,
         min_scale=min_scale,
         max_scale=max_scale,
         num_filter_banks=num_filter_banks,
-        normalize_amplitudes=normalize_amplitudes,
+        carrier_channel=carrier_channel,
         blocks=blocks,
+        auto_blocks=auto_blocks,
+        memory_headroom=memory_headroom,
+        normalize_amplitudes=normalize_amplitudes,
         use_gpu=use_gpu,
+        workers=workers,
         bank_method=bank_method,
         downsample_by=downsample_by,
         normalize_histogram=normalize_histogram,
         mean_center=mean_center,
-        carrier_channel=carrier_channel,
-        channel_outputs=channel_outputs,
-        wavelet=wavelet,
-        nv=nv
+        return_amplitude=return_amplitude,
+        return_scales=return_scales,
+        return_phase=return_phase,
+        return_z_score=return_z_score,
+        wavelet_choice=wavelet_choice,
+        wavelet_parameters=wavelet_parameters,
+        nv=nv,
+        time_start=time_start,
+        time_stop=time_stop,
+        roi_mask=None if roi_layer is None else layer_mask(roi_layer, layer.data.shape[-2:]),
+        mask_background=mask_background,
+        sparse=sparse,
+        keep_on_gpu=keep_on_gpu,
     )
-
-    return results
\ No newline at end of file
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Display helpers for large feature layers.
+
+@author: coylelab @ UW-Madison
+"""
+
+import dask.array as da
+import numpy as np
+
+from ._utils import DeviceArray, host_or_device
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def stack_channels(results, axis=1):
+    """Per-feature lazy stacks of the channels of a per-channel CWT result along `axis`.
+
+    Dask stacks with one (X, Y) plane per chunk (no consolidated copy);
+    GPU features become a DeviceArray stack.
+    """
+    per_feature = {}
+    on_device = {}
+    for channel_key, ch_data in results.items():
+        if channel_key == "_attrs" or not isinstance(ch_data, dict):
+            continue
+        for key, arr in ch_data.items():
+            if getattr(arr, "ndim", 0) < 2:
+                continue
+            if hasattr(arr, "detach") and arr.device.type != "cpu":
+                on_device.setdefault(key, []).append(arr)
+                continue
+            arr = host_or_device(arr) if hasattr(arr, "detach") else arr
+            chunks = (1,) * (arr.ndim - 2) + tuple(arr.shape[-2:])
+            # name=False skips hashing the whole buffer to build a dask key
+            per_feature.setdefault(key, []).append(da.from_array(arr, chunks=chunks, name=False))
+    stacks = {key: DeviceArray(tensors, axis=axis) for key, tensors in on_device.items()}
+    stacks.update((key, da.stack(arrays, axis=axis)) for key, arrays in per_feature.items())
+    return stacks
+
+
+def build_pyramid(data, min_size=256, factor=2):
+    """Multiscale levels of a (..., X, Y) array as strided views of the spatial axes.
+
+    No level is computed or copied: numpy levels are views, dask/zarr-backed
+    levels stay lazy, so building the pyramid is free and napari only reads
+    the pixels of the level it draws. Levels stop once both spatial axes
+    fit in `min_size`. DeviceArray levels are strided views on the device.
+    """
+    data = host_or_device(data) if hasattr(data, "detach") else data
+    levels = [data]
+    if data.ndim < 2:
+        return levels
+    step = factor
+    while max(data.shape[-2] // step, data.shape[-1] // step) >= min_size:
+        if isinstance(data, DeviceArray):
+            levels.append(data.downsampled(step))
+        else:
+            levels.append(data[..., ::step, ::step])
+        step *= factor
+    return levels
+
+
+def sample_contrast_limits(data, n_planes=8, max_plane_pixels=512 * 512,
+                           percentiles=(0.5, 99.5), seed=0):
+    """(low, high) contrast limits from the histogram of a few random planes.
+
+    Reads at most `n_planes` (X, Y) planes, each subsampled to about
+    `max_plane_pixels`, instead of scanning the whole array the way napari's
+    autoscaling does. Non-finite values are ignored.
+    """
+    data = host_or_device(data) if hasattr(data, "detach") else data
+    if data.ndim < 2:
+        data = np.asarray(data).reshape(1, 1, -1)
+    rng = np.random.default_rng(seed)
+    lead_shape = tuple(data.shape[:-2])
+    X, Y = data.shape[-2:]
+    step = max(1, int(np.ceil(np.sqrt(X * Y / max_plane_pixels))))
+
+    n_lead = int(np.prod(lead_shape)) if lead_shape else 1
+    picks = rng.choice(n_lead, size=min(n_planes, n_lead), replace=False)
+    samples = []
+    for flat in picks:
+        index = np.unravel_index(flat, lead_shape) if lead_shape else ()
+        plane = np.asarray(data[tuple(index) + (slice(None, None, step), slice(None, None, step))])
+        plane = plane.astype(np.float64, copy=False)
+        samples.append(plane[np.isfinite(plane)].ravel())
+    values = np.concatenate(samples) if samples else np.zeros(0)
+    if values.size == 0:
+        return 0.0, 1.0
+    low, high = np.percentile(values, percentiles)
+    if not high > low:
+        high = low + 1
+    return float(low), float(high)
@@ -1,19 +1,31 @@
 from magicgui import magicgui
+from pathlib import Path
 from napari.types import ImageData
 from napari.layers import Image
 from napari import current_viewer
 from qtpy.QtWidgets import QWidget
-import torch
 import numpy as np
 
 from cellstream.image import downsample  
 
+from ._utils import as_float32_tensor, host_or_device
+from ._features import downsample_job
+
 @magicgui(
     call_button="Downsample active image",
+    chunked={"tooltip": "Process chunk_frames frames at a time; works on lazy (dask/zarr) layers larger than RAM"},
+    chunk_frames={"min": 1, "max": 100000},
+    time_bin={"min": 1, "max": 100000, "tooltip": "Average every time_bin frames (chunked mode)"},
+    zarr_path={"mode": "w", "filter": "*.zarr"},
 )
 def downsample_gui_widget(
     downsample_by: float = 1,
     is_mask: bool = False,
+    chunked: bool = False,
+    chunk_frames: int = 16,
+    time_bin: int = 1,
+    write_to_zarr: bool = False,
+    zarr_path: Path = Path("downsampled.zarr"),
 ):
     
     viewer = current_viewer()
@@ -24,8 +36,18 @@ def downsample_gui_widget(
     if layer is None or not isinstance(layer, Image):
         raise RuntimeError("No active image layer selected")
 
-    img = layer.data
-    img = torch.from_numpy(img.astype('float32'))
+    data = layer.data[0] if layer.multiscale else layer.data
+    if chunked or time_bin > 1 or write_to_zarr:
+        return downsample_job(
+            data,
+            downsample_by=downsample_by,
+            is_mask=is_mask,
+            time_bin=time_bin,
+            chunk_frames=chunk_frames,
+            zarr_path=zarr_path if write_to_zarr else None,
+        )
+
+    img = as_float32_tensor(data)
  
     print("Genearting color-coded spectra...")
     ds = downsample(
@@ -34,5 +56,5 @@ def downsample_gui_widget(
         is_mask=is_mask
     )
 
-    ds=ds.detach().numpy()
+    ds=host_or_device(ds) # results of GPU-resident layers stay on the device for chained ops
     return ds
\ No newline at end of file
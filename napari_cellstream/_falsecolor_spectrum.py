@@ -3,11 +3,12 @@ from napari.types import ImageData
 from napari.layers import Image
 from napari import current_viewer
 from qtpy.QtWidgets import QWidget
-import torch
 import numpy as np
 
 from cellstream.image import color_by_axis  
 
+from ._utils import as_float32_tensor, host_or_device
+
 @magicgui(
     call_button="False-color spectrum",
 )
@@ -27,15 +28,16 @@ def false_color_widget(
     if layer is None or not isinstance(layer, Image):
         raise RuntimeError("No active image layer selected")
 
-    img = layer.data
-    img = torch.from_numpy(img.astype('float32'))
+    img = layer.data[0] if layer.multiscale else layer.data
 
-    #trim array and handle 5D cwt inputs
-    img_ndim=img.dim()
+    #trim array and handle 5D cwt inputs (sliced before conversion, so only the kept slices are read)
+    img_ndim=img.ndim
     if img_ndim==4:
-        img=img[min_slice:max_slice]
+        img=as_float32_tensor(img, (slice(min_slice,max_slice),))
     elif img_ndim==5: #coming from generate_cwt_features
-        img=img[:,:,min_slice:max_slice,:,:]
+        img=as_float32_tensor(img, (slice(None),slice(None),slice(min_slice,max_slice)))
+    else:
+        img=as_float32_tensor(img)
  
     print("Genearting color-coded spectra...")
     cc = color_by_axis(
@@ -43,5 +45,5 @@ def false_color_widget(
         cmap=colormap,
     )
 
-    cc=cc.detach().numpy()
+    cc=host_or_device(cc) # results of GPU-resident layers stay on the device for chained ops
     return cc
\ No newline at end of file
@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+"""
+FFT/CWT feature generation and downsampling jobs shared by the widgets and the CLI.
+
+@author: coylelab @ UW-Madison
+"""
+
+from functools import partial
+import time
+
+import numpy as np
+import torch
+import zarr
+
+from cellstream.fft import generate_fft_features
+from cellstream.cwt.utils import generate_cwt_image_cellstreams
+from cellstream.image import downsample
+
+from ._tiling import iter_tiles, read_tile, run_blockwise, progress_info, gather_pixels, scatter_pixels
+from ._regions import FeatureRegion, mask_outputs, resize_mask
+from ._memory import fft_bytes_per_pixel, cwt_bytes_per_pixel, plan_blocks
+from ._utils import select_device, as_float32_tensor, to_numpy
+from ._io import INDEX_PARAMS, make_compressor, finalize_result_store
+from ._normalize import FFT_NORMALIZED_FEATURES, CWT_NORMALIZED_FEATURES, normalize_features
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Options normalizing over all pixels of the image: cellstream computes the
+# blocks without them and normalize_features applies them to the stitched outputs
+FFT_GLOBAL_OPTIONS = ("normalize_histogram",)
+CWT_GLOBAL_OPTIONS = ("normalize_histogram", "normalize_amplitudes", "mean_center")
+
+
+def _record_params(result, **params):
+    """Add the job parameters to the result's `_attrs` (saved with it and summarized in the store index)."""
+    if isinstance(result, dict):
+        attrs = result.setdefault('_attrs', {})
+        if isinstance(attrs, dict):
+            for key, value in params.items():
+                attrs.setdefault(key, value)
+
+
+def fft_feature_list(amplitude=True, norm_amp=False, phase=False, z_score=True):
+    """Names of the FFT features to compute, in generate_fft_features order."""
+    features = []
+    if amplitude:
+        features.append('full_amplitude')
+    if norm_amp:
+        features.append('normalized_amplitude')
+    if phase:
+        features.append('phase')
+    if z_score:
+        features.append('z_score')
+    return features
+
+
+def cwt_channel_outputs(C, amplitude=True, scales=True, phase=False, z_score=True):
+    """channel_outputs for generate_cwt_image_cellstreams: same returns for each of C channels."""
+    channel_returns = []
+    if amplitude:
+        channel_returns.append('amp')
+    if scales:
+        channel_returns.append('freq')
+    if phase:
+        channel_returns.append('phase')
+    if z_score:
+        channel_returns.append('z_score')
+    return {c: list(channel_returns) for c in range(C)}
+
+
+def _region_mask(region, data):
+    """The region's background mask at the resolution of the (possibly downsampled) `data`."""
+    if region is None or region.mask is None:
+        return None
+    return resize_mask(region.mask, data.shape[-2:])
+
+
+def _record_region(result, region, data):
+    if region is not None:
+        x0, x1, _, _ = region.bounds
+        _record_params(result, **region.attrs(scale=data.shape[-2] / (x1 - x0)))
+
+
+def fft_feature_job(image_data, blocks, downsample_by, device, region=None, keep_on_device=False,
+                    **fft_kwargs):
+    """Generator computing FFT features in `blocks` row slabs; returns the assembled feature dict.
+
+    Histogram normalization is applied to the stitched features. With a
+    FeatureRegion only its cropped slab is read (offset in `_attrs["translate"]`).
+    """
+    if region is not None:
+        image_data = region.crop(image_data)
+    if downsample_by < 1:
+        logger.info(f"Downsampling image by {downsample_by}...")
+        image_data=downsample(as_float32_tensor(image_data),downsample_by)
+    
+    norm = {k: fft_kwargs.pop(k, False) for k in FFT_GLOBAL_OPTIONS}
+    
+    def run_block(slab):
+        slab = as_float32_tensor(slab)
+        return generate_fft_features(slab, batch_size=slab.numel(), device=device,
+                                     normalize_histogram=False, **fft_kwargs)
+    
+    mask = _region_mask(region, image_data)
+    result = yield from run_blockwise(run_block, image_data, blocks, mask=mask,
+                                      keep_on_device=keep_on_device)
+    normalize_features(result, FFT_NORMALIZED_FEATURES, mask=mask, **norm)
+    _record_params(result, downsample_by=downsample_by, max_bin=fft_kwargs.get("max_bin"),
+                   **norm)
+    _record_region(result, region, image_data)
+    return result
+
+
+def generate_fft_features_to_zarr(image_data, path, tile_size, device, region=None, **fft_kwargs):
+    """Generator writing FFT features of a (T, C, X, Y) array tile by tile into a Zarr group.
+
+    Only one tile is in memory at a time; histogram normalization runs over the written arrays afterwards.
+    """
+    if region is not None:
+        image_data = region.crop(image_data)
+    mask = _region_mask(region, image_data)
+    norm = {k: fft_kwargs.pop(k, False) for k in FFT_GLOBAL_OPTIONS}
+    X, Y = image_data.shape[-2:]
+    root = zarr.open_group(str(path), mode="w")
+    compressor = make_compressor()
+    outputs = {}
+    
+    tiles = list(iter_tiles(image_data.shape, tile_size))
+    if mask is not None:
+        tiles = [t for t in tiles if mask[t[0]:t[1], t[2]:t[3]].any()]
+    pixels_done = 0
+    start = time.time()
+    for i, (x0, x1, y0, y1) in enumerate(tiles):
+        tile = as_float32_tensor(read_tile(image_data, (x0, x1, y0, y1)))
+        features = generate_fft_features(tile, batch_size=tile.numel(), device=device,
+                                         normalize_histogram=False, **fft_kwargs)
+        if mask is not None:
+            features = mask_outputs(features, mask[x0:x1, y0:y1])
+        
+        for key, arr in features.items():
+            if key == '_attrs':
+                if i == 0:
+                    try:
+                        root.attrs.update(arr)
+                    except TypeError:
+                        logger.warning("Could not store FFT attributes in Zarr")
+                continue
+            if isinstance(arr, torch.Tensor):
+                arr = arr.detach().cpu().numpy()
+            if key not in outputs:
+                outputs[key] = root.create_dataset(
+                    key,
+                    shape=arr.shape[:-2] + (X, Y),
+                    chunks=arr.shape[:-2] + (tile_size, tile_size),
+                    dtype=arr.dtype,
+                    compressor=compressor,
+                )
+            outputs[key][..., x0:x1, y0:y1] = arr
+        pixels_done += (x1 - x0) * (y1 - y0)
+        yield progress_info(i + 1, len(tiles), pixels_done, start)
+    
+    normalize_features(outputs, FFT_NORMALIZED_FEATURES, mask=mask, n_slabs=-(-X // tile_size), **norm)
+    root.attrs.update(max_bin=fft_kwargs.get("max_bin"), tile_size=tile_size, **norm)
+    if region is not None:
+        root.attrs.update(region.attrs())
+    attrs = dict(root.attrs)
+    finalize_result_store(root, dict(outputs, _attrs=attrs))
+    return dict(outputs, _attrs=attrs)
+
+
+def cwt_block(slab, **cwt_kwargs):
+    """CWT features of one (T, C, rows, Y) slab (module level so worker processes can unpickle it)."""
+    slab = as_float32_tensor(slab)
+    return generate_cwt_image_cellstreams(img=slab, blocks=1, downsample_by=1.0, **cwt_kwargs)
+
+
+def _squeeze_table(table, n):
+    if isinstance(table, dict):
+        return {k: _squeeze_table(v, n) for k, v in table.items()}
+    if isinstance(table, (torch.Tensor, np.ndarray)) and table.ndim >= 2 and tuple(table.shape[-2:]) == (n, 1):
+        return table[..., 0]
+    return table
+
+
+def cwt_feature_job(img, blocks, downsample_by, workers=1, region=None, sparse=None,
+                    keep_on_device=False, **cwt_kwargs):
+    """Generator computing CWT features in `blocks` row slabs (over `workers` processes); returns the per-channel results.
+
+    With sparse="scatter" or "table" only the region mask's foreground pixels
+    are transformed, then scattered back or returned as (..., N) tables with "pixel_coords".
+    """
+    if region is not None:
+        img = region.crop(img)
+    if downsample_by != 1:
+        logger.info(f"Downsampling image by {downsample_by}...")
+        img = downsample(as_float32_tensor(img), downsample_by)
+    
+    norm = {k: cwt_kwargs.pop(k, False) for k in CWT_GLOBAL_OPTIONS}
+    block_fn = partial(cwt_block, **cwt_kwargs, **{k: False for k in norm})
+    run = partial(run_blockwise, block_fn, n_blocks=blocks, workers=workers, keep_on_device=keep_on_device)
+    mask = _region_mask(region, img)
+    if sparse:
+        if mask is None:
+            raise ValueError("Sparse CWT needs a Labels/Shapes mask with mask_background enabled")
+        pixels, coords = gather_pixels(img, mask)
+        logger.info(f"Sparse CWT over {len(coords)} foreground pixels "
+                    f"({100 * len(coords) / mask.size:.1f}% of the region)...")
+        # a (T, C, N, 1) column of pixels runs through the same blockwise path
+        table = yield from run(data=pixels[..., np.newaxis])
+        del pixels
+        normalize_features(table, CWT_NORMALIZED_FEATURES, **norm)
+        if sparse == "scatter":
+            result = scatter_pixels(table, coords, mask.shape)
+        else:
+            result = _squeeze_table(table, len(coords))
+            result["pixel_coords"] = coords.astype(np.int32)
+            _record_params(result, layout="table")
+    else:
+        result = yield from run(data=img, mask=mask)
+        normalize_features(result, CWT_NORMALIZED_FEATURES, mask=mask, **norm)
+    _record_params(result, downsample_by=downsample_by,
+                   **{k: v for k, v in dict(cwt_kwargs, **norm).items() if k in INDEX_PARAMS})
+    _record_region(result, region, img)
+    return result
+
+
+def _announce_plan(job, plan, blocks):
+    """Run `job` after a first progress step carrying the auto block plan (shown when the job starts)."""
+    logger.info(f"Auto block plan: {plan}")
+    info = progress_info(0, blocks, 0, time.time())
+    info.update(plan=str(plan))
+    yield info
+    return (yield from job)
+
+
+def _make_region(data, time_start, time_stop, roi_mask, mask_background):
+    """FeatureRegion for the job parameters, or None when the whole image is used."""
+    if time_start == 0 and time_stop <= 0 and roi_mask is None:
+        return None
+    return FeatureRegion(data.shape, time_start, time_stop, roi_mask, mask_background)
+
+
+def fft_job(
+    image_data,
+    normalize_histogram=True,
+    max_bin=128,
+    use_gpu=False,
+    blocks=1,
+    auto_blocks=False,
+    memory_headroom=0.25,
+    downsample_by=1,
+    return_amplitude=True,
+    return_norm_amp=False,
+    return_phase=False,
+    return_z_score=True,
+    stream_to_zarr=False,
+    tile_size=256,
+    zarr_path="fft_features.zarr",
+    time_start=0,
+    time_stop=0,
+    roi_mask=None,
+    mask_background=True,
+    memory_budget=None,
+    keep_on_gpu=False,
+):
+    """FFT feature job from the fft_gui_widget parameters (shared by the widget, CLI and batch queue).
+
+    Returns the blocked job, or the tile-by-tile Zarr job when `stream_to_zarr` is set.
+    """
+    region = _make_region(image_data, time_start, time_stop, roi_mask, mask_background)
+    fft_features_to_process=fft_feature_list(
+        return_amplitude, return_norm_amp, return_phase, return_z_score
+    )
+    device = select_device(use_gpu)
+    logger.info(f"Performing blocked FFT processing using device: {device}")
+    
+    fft_kwargs = dict(
+        normalize_histogram=normalize_histogram,
+        max_bin=max_bin,
+        fft_features_to_process=fft_features_to_process,
+    )
+    if stream_to_zarr:
+        if downsample_by < 1:
+            raise ValueError("Downsampling is not supported when streaming to Zarr; downsample the layer first")
+        logger.info(f"Streaming FFT features to {zarr_path} in {tile_size}x{tile_size} tiles...")
+        return generate_fft_features_to_zarr(image_data, zarr_path, tile_size, device, region=region, **fft_kwargs)
+    
+    if auto_blocks:
+        shape = image_data.shape if region is None else region.cropped_shape(image_data.shape)
+        T, C = shape[0], (shape[1] if len(shape) == 4 else 1)
+        X, Y = shape[-2:]
+        plan = plan_blocks(
+            X * Y,
+            fft_bytes_per_pixel(T, C, len(fft_features_to_process), max_bin),
+            device,
+            headroom=memory_headroom,
+            budget=memory_budget,
+        )
+        blocks = plan.blocks
+    
+    job = fft_feature_job(image_data, blocks, downsample_by, device, region=region,
+                          keep_on_device=keep_on_gpu and use_gpu, **fft_kwargs)
+    return _announce_plan(job, plan, blocks) if auto_blocks else job
+
+
+def cwt_job(
+    img,
+    min_scale=80,
+    max_scale=180,
+    num_filter_banks=1,
+    carrier_channel=0,
+    blocks=50,
+    auto_blocks=False,
+    memory_headroom=0.25,
+    normalize_amplitudes=False,
+    use_gpu=False,
+    workers=1,
+    bank_method='max_pool',
+    downsample_by=1.0,
+    normalize_histogram=True,
+    mean_center=False,
+    return_amplitude=True,
+    return_scales=True,
+    return_phase=False,
+    return_z_score=True,
+    wavelet_choice='gmw',
+    wavelet_parameters=None,
+    nv=32,
+    time_start=0,
+    time_stop=0,
+    roi_mask=None,
+    mask_background=True,
+    sparse="off",
+    memory_budget=None,
+    keep_on_gpu=False,
+):
+    """CWT feature job from the generate_cwt_features_widget parameters (shared by the widget, CLI and batch queue)."""
+    if img.ndim != 4:
+        raise ValueError(f"Expected image shape (T, C, X, Y), got {tuple(img.shape)}")
+    sparse = None if sparse == "off" else sparse
+    if sparse and roi_mask is None:
+        raise ValueError("Sparse CWT needs a Labels/Shapes roi_layer (or --mask) to select the pixels")
+    region = _make_region(img, time_start, time_stop, roi_mask, mask_background or bool(sparse))
+    T, C, X, Y = img.shape if region is None else region.cropped_shape(img.shape)
+    num_pixels = int(region.mask.sum()) if sparse else X * Y
+
+    #prepare channel_outputs parameter
+    channel_outputs=cwt_channel_outputs(
+        C, return_amplitude, return_scales, return_phase, return_z_score
+    )
+    
+    if workers > 1 and use_gpu:
+        logger.info("Parallel workers are CPU-only; running blocks sequentially on the GPU...")
+        workers = 1
+
+    if auto_blocks:
+        # every worker holds a block in flight, so the budget is shared between them
+        n_outputs = len(channel_outputs[0]) if C > 0 else 0
+        plan = plan_blocks(
+            num_pixels,
+            workers * cwt_bytes_per_pixel(T, C, n_outputs, nv, num_filter_banks, min_scale, max_scale),
+            select_device(use_gpu),
+            headroom=memory_headroom,
+            budget=memory_budget,
+        )
+        blocks = plan.blocks
+        if workers > 1:
+            blocks = max(blocks, 4 * workers)  # enough blocks to keep every worker busy
+
+    #prepare wavelet parameters:
+    if wavelet_parameters==None:
+        wavelet=wavelet_choice #pure string
+    else:
+        wavelet=(wavelet_choice,wavelet_parameters) # tuple
+
+    logger.info(f"Running CWT blockwise feature generation with {wavelet} and {nv}...")
+    job = cwt_feature_job(
+        img,
+        blocks,
+        downsample_by,
+        workers=workers,
+        min_scale=min_scale,
+        max_scale=max_scale,
+        num_filter_banks=num_filter_banks,
+        normalize_amplitudes=normalize_amplitudes,
+        use_gpu=use_gpu,
+        bank_method=bank_method,
+        normalize_histogram=normalize_histogram,
+        mean_center=mean_center,
+        carrier_channel=carrier_channel,
+        channel_outputs=channel_outputs,
+        wavelet=wavelet,
+        nv=nv,
+        region=region,
+        sparse=sparse,
+        keep_on_device=keep_on_gpu and use_gpu,
+    )
+    return _announce_plan(job, plan, blocks) if auto_blocks else job
+
+
+def _bin_frames(block, time_bin, is_mask=False):
+    """Average every `time_bin` frames of a (T, ...) tensor (masks keep the first frame of each bin)."""
+    if time_bin <= 1:
+        return block
+    if is_mask:
+        return block[::time_bin]
+    return torch.stack([block[t:t + time_bin].mean(dim=0) for t in range(0, block.shape[0], time_bin)])
+
+
+def downsample_job(data, downsample_by=1.0, is_mask=False, time_bin=1, chunk_frames=16, zarr_path=None):
+    """Generator downsampling a (T, ...) stack `chunk_frames` frames of one channel at a time.
+
+    Chunks hold whole frames (tiles would change the pixels at their edges) and
+    are written into a numpy array, or a Zarr array at `zarr_path`.
+    """
+    T = data.shape[0]
+    time_bin = max(1, int(time_bin))
+    chunk_frames = max(time_bin, chunk_frames - chunk_frames % time_bin)  # bins never straddle chunks
+    n_out = -(-T // time_bin)
+    channels = [(slice(c, c + 1),) for c in range(data.shape[1])] if data.ndim == 4 else [()]
+    pieces = [(t0, ch) for t0 in range(0, T, chunk_frames) for ch in channels]
+    out = None
+    start = time.time()
+    pixels_done = 0
+    for i, (t0, ch) in enumerate(pieces):
+        t1 = min(t0 + chunk_frames, T)
+        block = _bin_frames(as_float32_tensor(data, (slice(t0, t1),) + ch), time_bin, is_mask)
+        if downsample_by != 1:
+            block = downsample(tensor=block, scale=downsample_by, is_mask=is_mask)
+        block = to_numpy(block)
+        if out is None:
+            shape = (n_out,) + tuple(data.shape[1:-2]) + block.shape[-2:]
+            if zarr_path is None:
+                out = np.empty(shape, dtype=block.dtype)
+            else:
+                # one channel of whole frames per chunk, so each chunk is written once
+                chunks = ((block.shape[0],) + (1,) * (block.ndim - 3) + block.shape[-2:]
+                          if block.ndim >= 3 else True)
+                out = zarr.open(str(zarr_path), mode="w", shape=shape, chunks=chunks,
+                                dtype=block.dtype, compressor=make_compressor())
+        o0 = t0 // time_bin
+        out[(slice(o0, o0 + block.shape[0]),) + ch] = block
+        pixels_done += (t1 - t0) * int(np.prod(data.shape[-2:]))
+        info = progress_info(i + 1, len(pieces), pixels_done, start)
+        info.update(unit="chunk")
+        yield info
+    return out
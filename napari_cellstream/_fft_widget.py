@@ -1,29 +1,51 @@
 from magicgui import magicgui
-import numpy as np
-from napari.layers import Image
+from pathlib import Path
+from typing import Optional
+from napari.layers import Image, Layer
 from napari import current_viewer
 
-from cellstream.fft import generate_fft_features
-from cellstream.image import downsample
-import torch
+from ._features import fft_job
+from ._regions import layer_mask
+
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 #fft_features_to_process=['full_amplitude', 'normalized_amplitude', 'z_score', 'phase']
 @magicgui(
     call_button="Generate FFT features",
-    blocks={"min": 1, "max": 100000}
+    blocks={"min": 1, "max": 100000},
+    memory_headroom={"min": 0.0, "max": 0.95, "step": 0.05},
+    tile_size={"min": 16, "max": 16384},
+    zarr_path={"mode": "w", "filter": "*.zarr"},
+    time_start={"min": 0, "max": 1000000},
+    time_stop={"min": 0, "max": 1000000, "tooltip": "0 = last frame"},
+    roi_layer={"tooltip": "Shapes ROI or Labels mask restricting the computation (empty = full field)"},
+    mask_background={"tooltip": "Skip and zero pixels outside the ROI/mask, not just outside its bounding box"},
+    keep_on_gpu={"tooltip": "With use_gpu, keep the features on the GPU; only displayed slices are copied to host"},
    )
 def fft_gui_widget(
     normalize_histogram=True,
     max_bin=128,
     use_gpu: bool = False,
     blocks: int = 1,
+    auto_blocks: bool = False,
+    memory_headroom: float = 0.25,
     downsample_by: float=1,
 
     return_amplitude: bool = True,
     return_norm_amp: bool = False,
     return_phase: bool = False,
-    return_z_score: bool = True
+    return_z_score: bool = True,
+    stream_to_zarr: bool = False,
+    tile_size: int = 256,
+    zarr_path: Path = Path("fft_features.zarr"),
+    time_start: int = 0,
+    time_stop: int = 0,
+    roi_layer: Optional[Layer] = None,
+    mask_background: bool = True,
+    keep_on_gpu: bool = False,
 ):
     
     viewer = current_viewer()
@@ -34,51 +56,25 @@ def fft_gui_widget(
     if layer is None or not isinstance(layer, Image):
         raise RuntimeError("No active image layer selected")
 
-    fft_features_to_process=[]
-    if return_amplitude==True:
-        fft_features_to_process.append('full_amplitude')
-    if return_norm_amp==True:
-        fft_features_to_process.append('normalized_amplitude')
-    if return_phase==True:
-        fft_features_to_process.append('phase')
-    if return_z_score==True:
-        fft_features_to_process.append('z_score')
-        
-        
-    if use_gpu==True:
-        if torch.cuda.is_available():
-            device = torch.device("cuda")
-        elif torch.backends.mps.is_available():
-            device = torch.device("mps")  # For Macs with M1/M2 GPUs
-        else:
-            device = torch.device("cpu")
-            print("No GPU detected; switching to CPU mode...")
-    else:
-        device = torch.device("cpu")
-        
-        
-
-    print(f"Performing blocked FFT processing using device: {device}")
-        
-    image_data = layer.data
-    
-    num_pixels=image_data.size
-    batch_size=int(num_pixels/blocks)
-    
-    if isinstance(image_data, np.ndarray):
-        image_data = torch.from_numpy(image_data.astype('float32'))
-    
-    if downsample_by < 1:
-        print(f"Downsampling image by {downsample_by}...")
-        image_data=downsample(image_data,downsample_by)
-        
-    feature_dict = generate_fft_features(
-        image_data,
+    return fft_job(
+        layer.data,
         normalize_histogram=normalize_histogram,
         max_bin=max_bin,
-        batch_size=batch_size,
-        fft_features_to_process=fft_features_to_process,
-        device=device
+        use_gpu=use_gpu,
+        blocks=blocks,
+        auto_blocks=auto_blocks,
+        memory_headroom=memory_headroom,
+        downsample_by=downsample_by,
+        return_amplitude=return_amplitude,
+        return_norm_amp=return_norm_amp,
+        return_phase=return_phase,
+        return_z_score=return_z_score,
+        stream_to_zarr=stream_to_zarr,
+        tile_size=tile_size,
+        zarr_path=zarr_path,
+        time_start=time_start,
+        time_stop=time_stop,
+        roi_mask=None if roi_layer is None else layer_mask(roi_layer, layer.data.shape[-2:]),
+        mask_background=mask_background,
+        keep_on_gpu=keep_on_gpu,
     )
-    
-    return feature_dict
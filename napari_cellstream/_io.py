@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Image loading and Zarr result I/O shared by SpectralWidget and the CLI.
+
+@author: coylelab @ UW-Madison
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import numpy as np
+import torch
+import nd2
+import tifffile
+import zarr
+import dask.array as da
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('nd2', 'tif', 'tiff')
+
+# Root attribute holding the summary index of a result store
+INDEX_KEY = "cellstream_index"
+# Job parameters copied from `_attrs` into the summary index
+INDEX_PARAMS = ("wavelet", "nv", "min_scale", "max_scale", "num_filter_banks",
+                "bank_method", "max_bin", "normalize_histogram", "downsample_by")
+
+
+def open_tiff_lazy(path):
+    """Open a TIFF without reading pixel data: memmap if uncompressed, otherwise a dask view of its zarr store."""
+    try:
+        return tifffile.memmap(path, mode='r')
+    except ValueError:
+        logger.info("TIFF is not memory-mappable; falling back to zarr store")
+    store = tifffile.imread(path, aszarr=True)
+    z = zarr.open(store, mode='r')
+    if hasattr(z, "items"): # multiscale/series store -- take full resolution
+        z = z['0']
+    return da.from_zarr(z)
+
+
+def read_image(path, lazy=False, open_files=None):
+    """Read an ND2/TIFF time-lapse as (T, C, X, Y); returns (image, name).
+
+    With lazy=True the pixel data stays on disk (ND2 via to_dask, TIFF via
+    memmap/zarr). ND2 file handles backing lazy arrays are appended to
+    `open_files` so the caller can close them.
+    """
+    *iname, iext = path.split('.')
+    if iext == 'nd2':
+        if lazy:
+            nd2_file = nd2.ND2File(path)
+            if open_files is not None:
+                open_files.append(nd2_file)
+            image = nd2_file.to_dask()
+        else:
+            image = nd2.imread(path)
+    elif iext in ('tif', 'tiff'):
+        if lazy:
+            image = open_tiff_lazy(path)
+        else:
+            image = tifffile.imread(path)
+    else:
+        raise ValueError(f"Invalid image type: .{iext}")
+    #check dimension -- insert dummy channel dimension if need by
+    if image.ndim==3:
+        image=image[:, np.newaxis] # view, stays lazy for memmap/dask inputs
+        logger.info("Inserting channel dimension...")
+    return image, os.path.basename('.'.join(iname))
+
+
+def read_mask(path, shape):
+    """Boolean (X, Y) foreground (nonzero in any plane) of a .npy or TIFF labels/mask file."""
+    if str(path).endswith('.npy'):
+        labels = np.load(path, mmap_mode='r')
+    else:
+        labels = tifffile.imread(path)
+    if labels.shape[-2:] != tuple(shape):
+        raise ValueError(f"Mask {path} has shape {labels.shape[-2:]}, expected {tuple(shape)}")
+    return (np.asarray(labels) != 0).reshape(-1, *shape).any(axis=0)
+
+
+def make_compressor(cname="zstd", clevel=5, shuffle="bit"):
+    """Blosc compressor; `shuffle` is "none", "byte" or "bit"."""
+    shuffles = {"none": zarr.Blosc.NOSHUFFLE, "byte": zarr.Blosc.SHUFFLE, "bit": zarr.Blosc.BITSHUFFLE}
+    return zarr.Blosc(cname=cname, clevel=clevel, shuffle=shuffles[shuffle])
+
+
+def feature_chunks(shape, itemsize, layout="spatial", tile_size=256, pixel_block=8,
+                   max_chunk_bytes=64 * 1024**2):
+    """Chunk shape for a (T, ..., X, Y) feature array matching how it is read.
+
+    "spatial" gives (T, 1, ..., tile, tile) chunks for browsing the image; the
+    tile is halved while a chunk exceeds `max_chunk_bytes`. "pixel" gives
+    (T, 1, ..., k, k) chunks so a pixel's time series is one small read.
+    Arrays with fewer than two axes are left to zarr.
+    """
+    if len(shape) < 2:
+        return True
+    k = tile_size if layout == "spatial" else pixel_block
+    lead = () if len(shape) == 2 else (shape[0],) + (1,) * (len(shape) - 3)
+    kx, ky = min(k, shape[-2]), min(k, shape[-1])
+    lead_items = int(np.prod(lead)) if lead else 1
+    while layout == "spatial" and lead_items * kx * ky * itemsize > max_chunk_bytes and (kx > 16 or ky > 16):
+        kx, ky = -(-kx // 2), -(-ky // 2)
+    return lead + (max(kx, 1), max(ky, 1))
+
+
+def _numpy_dtype(v):
+    if isinstance(v, torch.Tensor):
+        return torch.empty((), dtype=v.dtype).numpy().dtype
+    return np.dtype(v.dtype)
+
+
+def _resolve_chunks(v, chunks, **chunk_kwargs):
+    if chunks in ("spatial", "pixel"):
+        return feature_chunks(tuple(v.shape), _numpy_dtype(v).itemsize, layout=chunks, **chunk_kwargs)
+    return chunks
+
+
+def _write_rows(z, v, x0, x1):
+    """Copy rows x0:x1 (second-to-last axis) of `v` into `z`; tensors are copied to host per slab."""
+    block = v[..., x0:x1, :]
+    if isinstance(block, torch.Tensor):
+        block = block.detach().cpu().numpy()
+    z[..., x0:x1, :] = np.asarray(block)
+
+
+def _write_all(z, v):
+    z[...] = v.detach().cpu().numpy() if isinstance(v, torch.Tensor) else np.asarray(v)
+
+
+def _array_write_tasks(z, v, region_bytes=32 * 1024**2):
+    """Callables writing `v` into `z` in chunk-aligned row slabs.
+
+    Slabs cover whole chunk rows, so no two threads ever encode the same chunk.
+    """
+    if z.ndim < 2:
+        return [partial(_write_all, z, v)]
+    X = z.shape[-2]
+    row_bytes = max(1, z.nbytes // max(X, 1))
+    rows = z.chunks[-2] * max(1, region_bytes // (row_bytes * z.chunks[-2]))
+    return [partial(_write_rows, z, v, x0, min(x0 + rows, X)) for x0 in range(0, X, rows)]
+
+
+def write_to_zarr(data, path, chunks="spatial", compressor="default", threads=None, **chunk_kwargs):
+    """Write an array or (nested) result dict to a Zarr store with `threads` writer threads.
+
+    `chunks` is "spatial", "pixel" (see feature_chunks), a chunk shape or True.
+    """
+    if compressor == "default":
+        compressor = make_compressor()
+    threads = threads or min(8, os.cpu_count() or 1)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        if isinstance(data, dict):
+            store = zarr.DirectoryStore(path)
+            root = zarr.group(store=store, overwrite=True)
+            futures = write_dict_to_zarr_group(root, data, chunks=chunks, compressor=compressor,
+                                               executor=executor, **chunk_kwargs)
+        elif hasattr(data, "shape") and hasattr(data, "dtype"):
+            z = zarr.open(path, mode="w", shape=tuple(data.shape), dtype=_numpy_dtype(data),
+                          chunks=_resolve_chunks(data, chunks, **chunk_kwargs), compressor=compressor)
+            futures = [executor.submit(task) for task in _array_write_tasks(z, data)]
+        else:
+            raise TypeError(f"Unsupported data type for write_to_zarr: {type(data)}")
+        for future in futures:
+            future.result()  # re-raise write errors
+    if isinstance(data, dict):
+        finalize_result_store(root, data)
+
+
+def write_dict_to_zarr_group(group, d, chunks=True, compressor=None, executor=None, **chunk_kwargs):
+    """Recursively write a result dict into a Zarr group.
+
+    With an `executor`, array writes are queued on it and the futures are
+    returned; otherwise they are written before returning.
+    """
+    futures = []
+    for k, v in d.items():
+        key = str(k)
+        if key == "_attrs" and isinstance(v, dict):
+            # stored as this group's attributes, where load_zarr_to_dict reads them back
+            group.attrs.update({str(ak): _json_safe(av) for ak, av in v.items()})
+        elif isinstance(v, dict):
+            subgroup = group.create_group(key)
+            futures += write_dict_to_zarr_group(subgroup, v, chunks=chunks, compressor=compressor,
+                                                executor=executor, **chunk_kwargs)
+        elif isinstance(v, (int, float, str, list, tuple)):
+            group.attrs[key] = _json_safe(v)
+        else:
+            if not (isinstance(v, torch.Tensor) or hasattr(v, "shape") and hasattr(v, "dtype")):
+                try:
+                    v = np.array(v)
+                except Exception:
+                    logger.warning(f"Could not save key {key} of type {type(v)} to Zarr.")
+                    continue
+            z = group.create_dataset(key, shape=tuple(v.shape), dtype=_numpy_dtype(v),
+                                     chunks=_resolve_chunks(v, chunks, **chunk_kwargs),
+                                     compressor=compressor)
+            for task in _array_write_tasks(z, v):
+                if executor is None:
+                    task()
+                else:
+                    futures.append(executor.submit(task))
+    return futures
+
+
+def _json_safe(v):
+    """Attribute value as plain JSON types (arrays/tensors become lists)."""
+    if isinstance(v, dict):
+        return {str(k): _json_safe(x) for k, x in v.items()}
+    if isinstance(v, (list, tuple)):
+        return [_json_safe(x) for x in v]
+    if isinstance(v, torch.Tensor):
+        v = v.detach().cpu().numpy()
+    if isinstance(v, (np.ndarray, np.generic)):
+        return v.tolist()
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    return str(v)
+
+
+def summarize_result(data):
+    """Small JSON index of a result dict: feature paths with shape/dtype, channel count and job parameters."""
+    features = {}
+    params = {}
+    
+    def walk(d, prefix):
+        for k, v in d.items():
+            if k == "_attrs" and isinstance(v, dict):
+                params.update({pk: _json_safe(pv) for pk, pv in v.items() if pk in INDEX_PARAMS})
+                continue
+            path = f"{prefix}/{k}" if prefix else str(k)
+            if isinstance(v, dict):
+                walk(v, path)
+            elif hasattr(v, "shape") and hasattr(v, "dtype"):
+                features[path] = {"shape": [int(n) for n in v.shape], "dtype": str(_numpy_dtype(v))}
+            elif k in INDEX_PARAMS:
+                params[k] = _json_safe(v)
+    walk(data, "")
+    
+    channel_groups = [k for k in data if str(k).isdigit()]
+    if channel_groups:
+        channels = len(channel_groups)
+    else:
+        shapes = [f["shape"] for f in features.values() if len(f["shape"]) == 4]
+        channels = shapes[0][1] if shapes else None
+    return {"version": 1, "features": features, "channels": channels, "params": params}
+
+
+def finalize_result_store(root, data):
+    """Store the summary index in the root attributes and consolidate the store's metadata.
+
+    After this the whole hierarchy (and the index) opens from the single
+    .zmetadata file.
+    """
+    root.attrs[INDEX_KEY] = summarize_result(data)
+    zarr.consolidate_metadata(root.store)
+
+
+def open_result_store(path):
+    """Open a result store read-only from its consolidated metadata, if it has any."""
+    try:
+        return zarr.open_consolidated(str(path), mode="r")
+    except KeyError:
+        logger.info(f"{path} has no consolidated metadata; opening node by node")
+        return zarr.open(str(path), mode="r")
+
+
+def describe_result_index(index):
+    """One-line description of a summary index for the results tree."""
+    parts = [f"{len(index.get('features', {}))} arrays"]
+    if index.get("channels"):
+        parts.append(f"{index['channels']} channel(s)")
+    params = index.get("params", {})
+    if "wavelet" in params:
+        wavelet = params["wavelet"]
+        parts.append(str(wavelet[0] if isinstance(wavelet, list) else wavelet))
+    if "nv" in params:
+        parts.append(f"nv={params['nv']}")
+    if "max_bin" in params:
+        parts.append(f"max_bin={params['max_bin']}")
+    return ", ".join(parts)
+
+
+def load_zarr_to_dict(zarr_item, lazy=True):
+    """Recursively loads a Zarr group or array into standard nested Python dictionaries/arrays.
+
+    With lazy=True arrays are returned as the zarr array handles themselves,
+    so only metadata is read; with lazy=False they are read into numpy.
+    """
+    if hasattr(zarr_item, "items"):
+        d = {}
+        for name, child in zarr_item.items():
+            # Protect against pulling virtual keys if the item is a custom wrapper
+            if name == "_attrs":
+                continue
+            d[name] = load_zarr_to_dict(child, lazy=lazy)
+        
+        # Group all attributes into a single nested dictionary
+        if hasattr(zarr_item, "attrs") and len(zarr_item.attrs) > 0:
+            d["_attrs"] = {}
+            for attr_key, attr_val in zarr_item.attrs.items():
+                if attr_key == INDEX_KEY:
+                    continue  # regenerated on save
+                d["_attrs"][attr_key] = attr_val
+            if not d["_attrs"]:
+                del d["_attrs"]
+                
+        return d
+        
+    elif hasattr(zarr_item, "shape") and hasattr(zarr_item, "dtype"):
+        if lazy:
+            return zarr_item
+        # Ensure we wrap the read safely across versions
+        return np.asarray(zarr_item[:])
+    else:
+        return zarr_item
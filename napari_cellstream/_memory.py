@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-aware block planning for the FFT/CWT feature jobs.
+
+@author: coylelab @ UW-Madison
+"""
+
+import math
+
+import psutil
+import torch
+
+
+
+def available_memory(device):
+    """Free bytes on `device`: VRAM for CUDA, system RAM otherwise (MPS shares it)."""
+    if device.type == "cuda":
+        free, _ = torch.cuda.mem_get_info(device)
+        return free
+    return psutil.virtual_memory().available
+
+
+def fft_bytes_per_pixel(T, C, n_outputs, max_bin, itemsize=4):
+    """Working bytes per spatial pixel of the blocked FFT feature generation."""
+    n_freq = T // 2 + 1
+    n_bins = min(max_bin, n_freq)
+    # float input + complex64 spectrum and its magnitude/phase temporaries + outputs
+    return C * (T * itemsize + n_freq * 8 * 2 + n_outputs * n_bins * 4)
+
+
+def cwt_bytes_per_pixel(T, C, n_outputs, nv, num_filter_banks, min_scale, max_scale, itemsize=4):
+    """Working bytes per spatial pixel of the blocked CWT feature generation."""
+    n_up = 2 ** (1 + round(math.log2(max(T, 2))))  # ssqueezepy reflect padding length
+    n_scales = nv * math.log2(n_up)                  # upper bound on log-piecewise scales
+    n_kept = max(max_scale - min_scale, 1)
+    per_channel = (
+        T * itemsize
+        + n_up * 8                      # padded signal spectrum
+        + 2 * n_scales * n_up * 8       # filtered spectra and coefficients (complex64)
+        + n_kept * T * 4                # kept scale range before pooling into banks
+        + n_outputs * num_filter_banks * T * 4
+    )
+    return C * per_channel
+
+
+class BlockPlan:
+    """Number of blocks chosen for a run, with the estimate it was based on."""
+
+    def __init__(self, blocks, pixels_per_block, bytes_per_pixel, budget, device):
+        self.blocks = blocks
+        self.pixels_per_block = pixels_per_block
+        self.bytes_per_pixel = bytes_per_pixel
+        self.budget = budget
+        self.device = device
+
+    def __str__(self):
+        peak = self.pixels_per_block * self.bytes_per_pixel / 1024**3
+        return (f"{self.blocks} block(s) of <= {self.pixels_per_block} pixels "
+                f"(~{peak:.2f} GiB each; budget {self.budget / 1024**3:.2f} GiB on {self.device})")
+
+
+def plan_blocks(num_pixels, bytes_per_pixel, device, headroom=0.25, budget=None):
+    """Fewest blocks whose working set fits in the free memory of `device`.
+
+    `headroom` is the fraction of currently free memory left untouched. An
+    explicit `budget` in bytes (e.g. one job's share of a batch) is used
+    as-is, capped by the free memory.
+    """
+    free = available_memory(device) * (1 - headroom)
+    budget = free if budget is None else min(budget, free)
+    pixels_per_block = max(1, min(num_pixels, int(budget // bytes_per_pixel)))
+    blocks = max(1, math.ceil(num_pixels / pixels_per_block))
+    plan = BlockPlan(blocks, pixels_per_block, bytes_per_pixel, budget, device)
+    return plan
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Whole-image normalization of assembled feature outputs.
+
+@author: coylelab @ UW-Madison
+"""
+
+import numpy as np
+import torch
+
+from ._tiling import row_slabs
+
+
+# Feature outputs the whole-image normalization options apply to
+FFT_NORMALIZED_FEATURES = ("full_amplitude",)
+CWT_NORMALIZED_FEATURES = ("amp",)
+
+
+def _spatial_mask(mask, arr):
+    """`mask` if it covers the spatial axes of `arr`, else None (e.g. for per-pixel tables)."""
+    if mask is None or tuple(mask.shape) != tuple(arr.shape[-2:]):
+        return None
+    return mask
+
+
+def _slab_mask(mask, slab, x0, x1):
+    if mask is None:
+        return None
+    m = mask[x0:x1]
+    if isinstance(slab, torch.Tensor):
+        return torch.from_numpy(np.ascontiguousarray(m)).to(slab.device)
+    return m
+
+
+def feature_stats(arr, mask=None, n_slabs=16):
+    """(min, max, mean) over the (foreground) pixels of a (..., X, Y) array, read in row slabs.
+
+    `arr` may be a numpy/memmap/zarr array or a tensor (reduced on its own
+    device); returns None when there are no foreground pixels.
+    """
+    mask = _spatial_mask(mask, arr)
+    lo, hi, total, count = np.inf, -np.inf, 0.0, 0
+    for x0, x1 in row_slabs(arr.shape[-2], n_slabs):
+        slab = arr[..., x0:x1, :]
+        if isinstance(slab, torch.Tensor):
+            slab = slab.double()
+        else:
+            slab = np.asarray(slab, dtype=np.float64)
+        m = _slab_mask(mask, slab, x0, x1)
+        values = slab if m is None else slab[..., m]
+        n = int(np.prod(values.shape))
+        if n == 0:
+            continue
+        lo = min(lo, float(values.min()))
+        hi = max(hi, float(values.max()))
+        total += float(values.sum())
+        count += n
+    if count == 0:
+        return None
+    return lo, hi, total / count
+
+
+def normalization_transform(stats, mean_center=False, normalize_amplitudes=False,
+                            normalize_histogram=False):
+    """(scale, offset) of the normalization options applied in turn, from feature_stats.
+
+    mean_center subtracts the mean, normalize_amplitudes divides by the
+    largest absolute value, and normalize_histogram stretches the values
+    to [0, 1].
+    """
+    scale, offset = 1.0, 0.0
+    if stats is None:
+        return scale, offset
+    lo, hi, mean = stats
+    if mean_center:
+        offset -= mean
+        lo, hi = lo - mean, hi - mean
+    if normalize_amplitudes:
+        peak = max(abs(lo), abs(hi))
+        if peak > 0:
+            scale, offset = scale / peak, offset / peak
+            lo, hi = lo / peak, hi / peak
+    if normalize_histogram and hi > lo:
+        scale, offset = scale / (hi - lo), (offset - lo) / (hi - lo)
+    return scale, offset
+
+
+def apply_transform(arr, scale, offset, mask=None, n_slabs=16):
+    """arr = arr * scale + offset in place, row slab by row slab; background pixels of `mask` stay as they are."""
+    if scale == 1.0 and offset == 0.0:
+        return
+    mask = _spatial_mask(mask, arr)
+    for x0, x1 in row_slabs(arr.shape[-2], n_slabs):
+        slab = arr[..., x0:x1, :]
+        m = _slab_mask(mask, slab, x0, x1)
+        if isinstance(slab, torch.Tensor):
+            new = slab * scale + offset
+            arr[..., x0:x1, :] = new if m is None else torch.where(m, new, slab)
+        else:
+            slab = np.asarray(slab)
+            new = (slab * scale + offset).astype(slab.dtype, copy=False)
+            arr[..., x0:x1, :] = new if m is None else np.where(m, new, slab)
+
+
+def normalize_features(outputs, features, mask=None, n_slabs=16, **options):
+    """Normalize the `features` arrays of (nested) feature outputs in place over all their pixels.
+
+    Second pass after the blocks are stitched (or the tiles are streamed to
+    Zarr), so the result does not depend on how the image was split. Each
+    array is normalized on its own; `options` are the flags of
+    normalization_transform, and background pixels of `mask` stay 0.
+    """
+    if not any(options.values()):
+        return
+    for key, value in outputs.items():
+        if isinstance(value, dict):
+            normalize_features(value, features, mask, n_slabs, **options)
+        elif key in features and getattr(value, "ndim", 0) >= 2:
+            scale, offset = normalization_transform(feature_stats(value, mask, n_slabs), **options)
+            apply_transform(value, scale, offset, mask, n_slabs)
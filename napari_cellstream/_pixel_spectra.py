@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Pixel inspector helpers: per-pixel spectra computation and caching.
+
+@author: coylelab @ UW-Madison
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from ssqueezepy import Wavelet
+from ssqueezepy.utils import p2up, process_scales
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def wavelet_key(wavelet_tuple):
+    """Hashable form of a (name, params_dict) wavelet tuple."""
+    name, params = wavelet_tuple
+    return (name, tuple(sorted(params.items())))
+
+
+class WaveletFilterBank:
+    """Frequency-domain CWT filters for a fixed (wavelet, nv, T).
+
+    Follows the ssqueezepy.cwt defaults (log-piecewise scales, reflect padding
+    to p2up(T), L1 norm, filters sampled with nohalf=False), but builds the Wavelet, its scales and the sampled
+    filters once so each transform is a single FFT, multiply and inverse FFT.
+    """
+
+    def __init__(self, wavelet_tuple, nv, n_samples):
+        self.key = self.make_key(wavelet_tuple, nv, n_samples)
+        self.n_samples = n_samples
+        self.n_up, self.n1, self.n2 = p2up(n_samples)
+
+        self.wavelet = Wavelet(wavelet_tuple, N=self.n_up)
+        self.scales = np.asarray(
+            process_scales('log-piecewise', n_samples, self.wavelet, nv=nv)
+        ).reshape(-1, 1)
+        psih = self.wavelet(scale=self.scales, N=self.n_up, nohalf=False)
+        if isinstance(psih, torch.Tensor):
+            psih = psih.cpu().numpy()
+        self.psih = np.asarray(psih)
+        self._device_psih = {}
+        logger.debug(f"Built filter bank: {self.psih.shape[0]} scales, padded length {self.n_up}")
+
+    @staticmethod
+    def make_key(wavelet_tuple, nv, n_samples):
+        return (wavelet_key(wavelet_tuple), nv, n_samples)
+
+    def _pad(self, x):
+        pad = [(0, 0)] * (x.ndim - 1) + [(self.n1, self.n2)]
+        xp = np.pad(x, pad, mode='reflect')
+        return xp - xp.mean(axis=-1, keepdims=True)
+
+    def psih_on(self, device):
+        """Filters as a complex64 tensor on `device` (uploaded once per device)."""
+        if device not in self._device_psih:
+            self._device_psih[device] = torch.from_numpy(self.psih.astype(np.complex64)).to(device)
+        return self._device_psih[device]
+
+    def transform(self, x):
+        """CWT coefficients (..., n_scales, T) of traces with time on the last axis."""
+        xf = np.fft.fft(self._pad(x), axis=-1)
+        Wx = np.fft.ifft(xf[..., np.newaxis, :] * self.psih, axis=-1)
+        return Wx[..., self.n1:self.n1 + self.n_samples]
+
+    def transform_torch(self, x, device):
+        """Same as `transform`, computed with torch on `device`; returns a tensor."""
+        xp = torch.from_numpy(self._pad(x).astype(np.float32)).to(device)
+        xf = torch.fft.fft(xp, dim=-1)
+        Wx = torch.fft.ifft(xf.unsqueeze(-2) * self.psih_on(device), dim=-1)
+        return Wx[..., self.n1:self.n1 + self.n_samples]
+
+
+def read_roi_traces(data, bounds, mask=None, average=None, chunk_bytes=64 * 1024**2):
+    """Mean-centered (C, N, T) float32 traces of the ROI pixels selected by `mask`, read in row chunks.
+
+    With average="trace" the chunks are summed while reading and the (C, 1, T) mean trace is returned.
+    """
+    x0, x1, y0, y1 = bounds
+    T, C = data.shape[:2]
+    step = max(1, chunk_bytes // (T * C * max(y1 - y0, 1) * 4))
+    parts, total, n = [], 0, 0
+    for r0 in range(x0, x1, step):
+        r1 = min(r0 + step, x1)
+        rows = np.asarray(data[:, :, r0:r1, y0:y1], dtype=np.float32).reshape(T, C, -1)
+        if mask is not None:
+            rows = rows[:, :, mask[r0 - x0:r1 - x0].ravel()]
+        if average == "trace":
+            total = total + rows.sum(axis=-1, dtype=np.float64)
+            n += rows.shape[-1]
+        else:
+            parts.append(rows)
+    if average == "trace":
+        traces = (np.asarray(total, dtype=np.float64) / max(n, 1)).T[:, np.newaxis, :]
+    else:
+        traces = np.concatenate(parts, axis=-1).transpose(1, 2, 0)
+    traces = np.ascontiguousarray(traces, dtype=np.float32)
+    traces -= traces.mean(axis=-1, keepdims=True)
+    return traces
+
+
+def compute_pixel_spectra(traces, filter_bank, device=None):
+    """Raw (un-normalized) FFT and CWT magnitudes of mean-centered (C, T) traces.
+
+    All channels are transformed in one batched call; on a non-CPU torch device
+    the FFTs run there and only the magnitudes are copied back.
+    """
+    if device is not None and device.type != "cpu":
+        ts = torch.from_numpy(traces.astype(np.float32)).to(device)
+        fft = torch.fft.rfft(ts, dim=-1).abs().cpu().numpy()
+        cwt_mag = filter_bank.transform_torch(traces, device).abs().cpu().numpy()
+    else:
+        fft = np.abs(np.fft.rfft(traces, axis=-1))
+        cwt_mag = np.abs(filter_bank.transform(traces))
+    return {"ts": traces, "fft": fft, "cwt": cwt_mag}
+
+
+def compute_roi_spectra(traces, filter_bank, device=None, average="trace",
+                        chunk_bytes=64 * 1024**2):
+    """Spectra of (C, N, T) ROI traces, returned with (C, ...) shapes.
+
+    average="trace" transforms the mean trace. average="spectrum" averages the
+    per-pixel magnitude spectra (Welch-style), transforming pixels in batches of
+    at most `chunk_bytes` of CWT coefficients.
+    """
+    C, N, T = traces.shape
+    ts = traces.mean(axis=1)
+    if average == "trace" or N == 1:
+        return compute_pixel_spectra(ts, filter_bank, device=device)
+
+    per_pixel = C * filter_bank.psih.shape[0] * filter_bank.n_up * 16
+    step = max(1, chunk_bytes // per_pixel)
+    fft = 0
+    cwt_mag = 0
+    for i in range(0, N, step):
+        part = compute_pixel_spectra(traces[:, i:i + step], filter_bank, device=device)
+        fft = fft + part["fft"].sum(axis=1)
+        cwt_mag = cwt_mag + part["cwt"].sum(axis=1)
+    return {"ts": ts, "fft": fft / N, "cwt": cwt_mag / N}
+
+
+class SpectraCache:
+    """Bounded LRU cache of per-pixel spectra.
+
+    Keys are tuples whose first element is the id of the source layer, so all
+    entries of a layer can be dropped when it changes or is removed. Values are
+    dicts of arrays; the cache is bounded by their total size in bytes.
+    """
+
+    def __init__(self, max_bytes=256 * 1024**2):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _sizeof(value):
+        return sum(getattr(v, "nbytes", 0) for v in value.values())
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if key in self._entries:
+            self._nbytes -= self._sizeof(self._entries.pop(key))
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._nbytes += size
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._nbytes -= self._sizeof(evicted)
+
+    def invalidate_layer(self, layer_id):
+        for key in [k for k in self._entries if k[0] == layer_id]:
+            self._nbytes -= self._sizeof(self._entries.pop(key))
+
+    def clear(self):
+        self._entries.clear()
+        self._nbytes = 0
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Time-window / ROI / mask restriction of the feature jobs.
+
+@author: coylelab @ UW-Madison
+"""
+
+import numpy as np
+import torch
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def mask_bounds(mask):
+    """(x0, x1, y0, y1) bounding box of the True pixels of a 2D mask, or None if it is empty."""
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+
+def layer_mask(layer, shape):
+    """Boolean (X, Y) foreground of a Shapes layer (union of its shapes) or Labels layer (label > 0).
+
+    Labels with extra leading axes (e.g. time) are projected: a pixel is
+    foreground if it is labelled in any plane.
+    """
+    if hasattr(layer, "to_masks"):
+        masks = np.asarray(layer.to_masks(mask_shape=shape))
+        return masks.any(axis=0) if len(masks) else np.zeros(shape, bool)
+    labels = np.asarray(layer.data)
+    if labels.shape[-2:] != tuple(shape):
+        raise ValueError(f"Mask layer shape {labels.shape[-2:]} does not match image {tuple(shape)}")
+    return (labels != 0).reshape(-1, *shape).any(axis=0)
+
+
+def shapes_mask_at(layer, x, y, shape):
+    """((x0, x1, y0, y1), mask, hits) of the Shapes-layer shapes containing pixel (x, y), or None.
+
+    Only shapes whose vertex bounding box contains the pixel are rasterized,
+    each over its own clipped box, instead of building a full (X, Y) mask per
+    shape. `mask` covers the bounds; `hits` are the indices of the shapes.
+    """
+    X, Y = shape
+    boxes, hits = [], []
+    for i, vertices in enumerate(layer.data):
+        points = np.asarray(vertices)[:, -2:]
+        x0, y0 = np.maximum(np.floor(points.min(axis=0)).astype(int), 0)
+        x1, y1 = np.minimum(np.ceil(points.max(axis=0)).astype(int) + 1, (X, Y))
+        if not (x0 <= x < x1 and y0 <= y < y1):
+            continue
+        mask = np.asarray(layer._data_view.shapes[i].to_mask((x1 - x0, y1 - y0), offset=(x0, y0)), bool)
+        if mask[x - x0, y - y0]:
+            boxes.append((x0, x1, y0, y1, mask))
+            hits.append(i)
+    if not hits:
+        return None
+    x0, y0 = min(b[0] for b in boxes), min(b[2] for b in boxes)
+    x1, y1 = max(b[1] for b in boxes), max(b[3] for b in boxes)
+    full_mask = np.zeros((x1 - x0, y1 - y0), bool)
+    for bx0, bx1, by0, by1, mask in boxes:
+        full_mask[bx0 - x0:bx1 - x0, by0 - y0:by1 - y0] |= mask
+    return (x0, x1, y0, y1), full_mask, tuple(hits)
+
+
+def resize_mask(mask, shape):
+    """Nearest-neighbour resample of a 2D mask to `shape` (to follow downsampling)."""
+    if mask.shape == tuple(shape):
+        return mask
+    rows = (np.arange(shape[0]) * mask.shape[0] // shape[0])
+    cols = (np.arange(shape[1]) * mask.shape[1] // shape[1])
+    return mask[np.ix_(rows, cols)]
+
+
+def mask_tiles(mask, slabs):
+    """Trim (x0, x1) row slabs to the foreground they contain.
+
+    Returns (x0, x1, y0, y1) tiles covering every True pixel; slabs without
+    foreground are dropped, so background rows/columns are never transformed.
+    """
+    tiles = []
+    for x0, x1 in slabs:
+        bounds = mask_bounds(mask[x0:x1])
+        if bounds is not None:
+            r0, r1, c0, c1 = bounds
+            tiles.append((x0 + r0, x0 + r1, c0, c1))
+    return tiles
+
+
+def mask_outputs(block_out, mask):
+    """Zero the background pixels of every (..., rows, cols) leaf of a block's outputs."""
+    if isinstance(block_out, dict):
+        return {k: mask_outputs(v, mask) for k, v in block_out.items()}
+    if isinstance(block_out, torch.Tensor) and block_out.shape[-2:] == mask.shape:
+        return block_out * torch.from_numpy(mask).to(block_out.device)
+    if isinstance(block_out, np.ndarray) and block_out.shape[-2:] == mask.shape:
+        return np.where(mask, block_out, 0).astype(block_out.dtype, copy=False)
+    return block_out
+
+
+class FeatureRegion:
+    """Part of a (T, C, X, Y) image a feature job runs on.
+
+    The time window is [time_start, time_stop) (time_stop <= 0 means the
+    last frame). With a `roi_mask` (full-size boolean) the job reads only
+    its bounding box; if `mask_background` is set, pixels outside the mask
+    are also skipped where possible and zeroed in the outputs.
+    """
+
+    def __init__(self, shape, time_start=0, time_stop=0, roi_mask=None, mask_background=True):
+        T = shape[0]
+        X, Y = shape[-2:]
+        self.t0 = int(time_start)
+        self.t1 = int(time_stop) if time_stop > 0 else T
+        if not 0 <= self.t0 < self.t1 <= T:
+            raise ValueError(f"Invalid time window [{time_start}, {time_stop}) for {T} frames")
+        
+        self.mask = None
+        if roi_mask is None:
+            self.bounds = (0, X, 0, Y)
+        else:
+            roi_mask = np.asarray(roi_mask, dtype=bool)
+            if roi_mask.shape != (X, Y):
+                raise ValueError(f"ROI mask shape {roi_mask.shape} does not match image ({X}, {Y})")
+            self.bounds = mask_bounds(roi_mask)
+            if self.bounds is None:
+                raise ValueError("The ROI/mask layer has no foreground pixels")
+            x0, x1, y0, y1 = self.bounds
+            if mask_background:
+                self.mask = roi_mask[x0:x1, y0:y1]
+        x0, x1, y0, y1 = self.bounds
+        logger.info(f"Feature region: t=[{self.t0}, {self.t1}), x=[{x0}, {x1}), y=[{y0}, {y1})"
+                    + (f", {int(self.mask.sum())} masked pixels" if self.mask is not None else ""))
+
+    def cropped_shape(self, shape):
+        x0, x1, y0, y1 = self.bounds
+        return (self.t1 - self.t0,) + tuple(shape[1:-2]) + (x1 - x0, y1 - y0)
+
+    def crop(self, data):
+        """The region's (t, ..., x, y) slab of `data`; a view for numpy/torch/dask inputs."""
+        x0, x1, y0, y1 = self.bounds
+        return data[self.t0:self.t1, ..., x0:x1, y0:y1]
+
+    def attrs(self, scale=1.0):
+        """Region description stored in the result `_attrs`.
+
+        `translate` is the (x, y) offset in output pixels; `time_offset` is
+        the first frame, for outputs that keep the time axis (CWT features).
+        """
+        x0, x1, y0, y1 = self.bounds
+        return {
+            "time_range": [self.t0, self.t1],
+            "time_offset": self.t0,
+            "roi_bounds": [x0, x1, y0, y1],
+            "translate": [x0 * scale, y0 * scale],
+        }
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Session result store: each feature result is held once in host memory and
+spilled to a local Zarr cache when the store goes over its RAM budget.
+
+@author: coylelab @ UW-Madison
+"""
+
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from ._io import load_zarr_to_dict, make_compressor, open_result_store, write_to_zarr
+from ._utils import to_numpy
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def to_host(result):
+    """Nested result with every CPU tensor replaced by its numpy view (no copy).
+
+    Tensors on a GPU are left there: they were kept on the device on purpose
+    (keep_on_gpu) and are only copied to host slice by slice for display.
+    """
+    if isinstance(result, dict):
+        return {k: to_host(v) for k, v in result.items()}
+    if hasattr(result, "detach") and result.device.type == "cpu":
+        return to_numpy(result)
+    return result
+
+
+def resolve_result_path(result, path):
+    """Leaf of a nested result at the keys in `path`, or None.
+
+    int keys (CWT channels) also match the str keys a result has once it
+    was spilled and reloaded from Zarr.
+    """
+    val = result
+    for key in path:
+        if not isinstance(val, dict):
+            return None
+        if key not in val and str(key) in val:
+            key = str(key)
+        if key not in val:
+            return None
+        val = val[key]
+    return val
+
+
+def resident_bytes(result, on_device=False):
+    """Host RAM bytes of the in-memory arrays of a nested result (Zarr/dask leaves count 0).
+
+    With `on_device`, the bytes of its GPU tensors instead.
+    """
+    if isinstance(result, dict):
+        return sum(resident_bytes(v, on_device) for v in result.values())
+    if isinstance(result, np.ndarray):
+        return 0 if on_device else result.nbytes
+    if hasattr(result, "detach"):
+        if (result.device.type != "cpu") != on_device:
+            return 0
+        return result.element_size() * result.nelement()
+    return 0
+
+
+class ResultStore:
+    """LRU store of nested feature results bounded by a host RAM budget, spilling to a Zarr cache.
+
+    Spills run as begin_spill / write_cache (any thread) / finish_spill, which
+    calls `on_spill(key, result)` with the lazy Zarr handles. GPU tensors
+    are counted apart, in `device_nbytes`.
+    """
+
+    def __init__(self, max_bytes=8 * 1024**3, cache_dir=None, on_spill=None, clevel=1):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self._own_cache_dir = cache_dir is None
+        self.on_spill = on_spill
+        self.clevel = clevel
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._device_sizes = {}
+        self._spilled = {}
+        self._pending = set()
+        self._n_written = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def nbytes(self):
+        return sum(self._sizes.values())
+
+    @property
+    def device_nbytes(self):
+        return sum(self._device_sizes.values())
+
+    def is_spilled(self, key):
+        return key in self._spilled
+
+    def add(self, key, result):
+        """Store `result` under `key` and return the stored version (nothing is spilled here)."""
+        if key in self._entries:
+            self.release(key)
+        result = to_host(result)
+        self._entries[key] = result
+        self._sizes[key] = resident_bytes(result)
+        self._device_sizes[key] = resident_bytes(result, on_device=True)
+        return result
+
+    def get(self, key):
+        result = self._entries.get(key)
+        if result is not None:
+            self._entries.move_to_end(key)
+        return result
+
+    def set_budget(self, max_bytes):
+        self.max_bytes = max_bytes
+
+    def over_budget(self, keep=()):
+        """Least recently used resident keys to spill to get under the budget.
+
+        Keys in `keep` (e.g. the result just added) and spills already in
+        progress are never returned, so a single result larger than the
+        budget stays resident while it is the one in use.
+        """
+        excess = self.nbytes - self.max_bytes - sum(self._sizes[k] for k in self._pending)
+        keys = []
+        for key in self._entries:
+            if excess <= 0:
+                break
+            if key in keep or key in self._pending or not self._sizes.get(key):
+                continue
+            keys.append(key)
+            excess -= self._sizes[key]
+        return keys
+
+    def begin_spill(self, key):
+        """(key, result, path) for a spill of `key`; pass it to write_cache, then finish_spill."""
+        if self.cache_dir is None:
+            self.cache_dir = tempfile.mkdtemp(prefix="cellstream_results_")
+        self._n_written += 1
+        path = os.path.join(self.cache_dir, f"result_{self._n_written}.zarr")
+        self._pending.add(key)
+        return key, self._entries[key], path
+
+    def write_cache(self, key, result, path):
+        """Write `result` to the cache at `path`; safe to run in a worker thread."""
+        compressor = make_compressor(clevel=self.clevel) if self.clevel > 0 else None
+        write_to_zarr(result, path, compressor=compressor)
+        return key, result, path
+
+    def finish_spill(self, key, result, path):
+        """Replace the resident result by lazy handles to its cache (dropped if it changed meanwhile)."""
+        self._pending.discard(key)
+        if self._entries.get(key) is not result:
+            shutil.rmtree(path, ignore_errors=True)  # released or replaced while writing
+            return
+        spilled = load_zarr_to_dict(open_result_store(path), lazy=True)
+        logger.info(f"Spilled result {key} ({self._sizes[key] / 1024**2:.0f} MB) to {path}")
+        self._entries[key] = spilled
+        self._sizes[key] = 0
+        self._device_sizes[key] = 0
+        self._spilled[key] = path
+        if self.on_spill is not None:
+            self.on_spill(key, spilled)
+
+    def cancel_spill(self, key):
+        """Forget an unfinished spill of `key` (e.g. after a failed write)."""
+        self._pending.discard(key)
+
+    def spill(self, key):
+        """Write a resident result to the Zarr cache and keep only lazy handles to it."""
+        if key not in self._entries or not self._sizes.get(key) or key in self._pending:
+            return
+        self.finish_spill(*self.write_cache(*self.begin_spill(key)))
+
+    def evict(self, keep=()):
+        """Spill least recently used results until the store is under its budget."""
+        for key in self.over_budget(keep=keep):
+            self.spill(key)
+
+    def release(self, key):
+        """Drop a result and its cache files."""
+        self._entries.pop(key, None)
+        self._sizes.pop(key, None)
+        self._device_sizes.pop(key, None)
+        path = self._spilled.pop(key, None)
+        if path is not None:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def clear(self):
+        for key in list(self._entries):
+            self.release(key)
+        if self._own_cache_dir and self.cache_dir is not None:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self.cache_dir = None
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial tiling helpers for processing (T, C, X, Y) stacks in bounded memory.
+
+@author: coylelab @ UW-Madison
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import torch
+
+from ._utils import as_float32_array, to_numpy
+from ._regions import mask_tiles, mask_outputs
+
+
+def iter_tiles(shape, tile_size):
+    """Yield (x0, x1, y0, y1) tiles covering the last two axes of `shape`."""
+    X, Y = shape[-2:]
+    for x0 in range(0, X, tile_size):
+        for y0 in range(0, Y, tile_size):
+            yield x0, min(x0 + tile_size, X), y0, min(y0 + tile_size, Y)
+
+
+def read_tile(data, tile):
+    """Read one spatial tile of every leading axis as float32; only that slab is pulled from lazy arrays."""
+    x0, x1, y0, y1 = tile
+    return as_float32_array(data, (Ellipsis, slice(x0, x1), slice(y0, y1)))
+
+
+def row_slabs(X, n_blocks):
+    """Split range(X) into at most `n_blocks` contiguous (x0, x1) slabs of near-equal size."""
+    n_blocks = max(1, min(int(n_blocks), X))
+    edges = np.linspace(0, X, n_blocks + 1).astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:])]
+
+
+def gather_pixels(data, mask, n_slabs=16):
+    """(..., N) float32 time series of the N True pixels of `mask` (row-major), and their (N, 2) coords.
+
+    `data` is read in foreground-trimmed row slabs, so only the mask's
+    bounding rows/columns are pulled from lazy inputs.
+    """
+    coords = np.argwhere(mask)
+    pixels = np.empty(tuple(data.shape[:-2]) + (len(coords),), dtype=np.float32)
+    i = 0
+    for x0, x1, y0, y1 in mask_tiles(mask, row_slabs(mask.shape[0], n_slabs)):
+        tile_mask = mask[x0:x1, y0:y1]
+        n = int(tile_mask.sum())
+        pixels[..., i:i + n] = as_float32_array(data, (Ellipsis, slice(x0, x1), slice(y0, y1)))[..., tile_mask]
+        i += n
+    return pixels, coords
+
+
+def scatter_pixels(table, coords, shape):
+    """Full-size (..., X, Y) outputs from per-pixel (..., N, 1) outputs; pixels not in `coords` are 0."""
+    if isinstance(table, dict):
+        return {k: scatter_pixels(v, coords, shape) for k, v in table.items()}
+    if not (isinstance(table, (torch.Tensor, np.ndarray)) and table.ndim >= 2
+            and tuple(table.shape[-2:]) == (len(coords), 1)):
+        return table
+    values = to_numpy(table)[..., 0]
+    out = np.zeros(values.shape[:-1] + tuple(shape), dtype=values.dtype)
+    out[..., coords[:, 0], coords[:, 1]] = values
+    return out
+
+
+def progress_info(done, total, pixels_done, start):
+    """Progress dict yielded by the block generators: blocks done, pixels/s and ETA (s)."""
+    elapsed = time.time() - start
+    rate = pixels_done / elapsed if elapsed > 0 else float("nan")
+    eta = elapsed / done * (total - done) if done else float("nan")
+    return {"done": done, "total": total, "pixels_per_s": rate, "eta": eta, "elapsed": elapsed}
+
+
+def _allocate_like(block_out, X, Y, tile, allocated, memmap_dir=None, zeros=False, on_device=False):
+    """Full-size outputs shaped after the first block's outputs (non-spatial leaves are kept as-is).
+
+    Buffers are recorded in `allocated`; `memmap_dir` makes them shared
+    memmaps, `on_device` keeps tensors on their device.
+    """
+    if isinstance(block_out, dict):
+        return {k: _allocate_like(v, X, Y, tile, allocated, memmap_dir, zeros, on_device)
+                for k, v in block_out.items()}
+    x0, x1, y0, y1 = tile
+    is_tensor = isinstance(block_out, torch.Tensor)
+    if (not (is_tensor or isinstance(block_out, np.ndarray)) or block_out.ndim < 2
+            or tuple(block_out.shape[-2:]) != (x1 - x0, y1 - y0)):
+        return block_out
+    
+    shape = tuple(block_out.shape[:-2]) + (X, Y)
+    path = None
+    if memmap_dir is not None:
+        dtype = block_out.detach().cpu().numpy().dtype if is_tensor else block_out.dtype
+        path = os.path.join(memmap_dir, f"block_output_{len(allocated)}.dat")
+        out = np.memmap(path, mode="w+", dtype=dtype, shape=shape)  # zero-filled
+    elif is_tensor:
+        device = block_out.device if on_device else "cpu"
+        out = (torch.zeros if zeros else torch.empty)(shape, dtype=block_out.dtype, device=device)
+    else:
+        out = (np.zeros if zeros else np.empty)(shape, dtype=block_out.dtype)
+    allocated[id(out)] = path
+    return out
+
+
+def _write_block(out, block_out, tile, allocated):
+    if isinstance(out, dict):
+        for k, v in block_out.items():
+            _write_block(out[k], v, tile, allocated)
+    elif id(out) in allocated:
+        x0, x1, y0, y1 = tile
+        if isinstance(out, torch.Tensor):
+            out[..., x0:x1, y0:y1] = block_out.detach().to(out.device)
+        elif isinstance(block_out, torch.Tensor):
+            out[..., x0:x1, y0:y1] = block_out.detach().cpu().numpy()
+        else:
+            out[..., x0:x1, y0:y1] = block_out
+
+
+def _memmap_specs(out, allocated):
+    """Picklable (path, dtype, shape) description of the memmapped outputs."""
+    if isinstance(out, dict):
+        return {k: _memmap_specs(v, allocated) for k, v in out.items()}
+    if allocated.get(id(out)) is None:
+        return None
+    return (allocated[id(out)], out.dtype.str, out.shape)
+
+
+def _write_block_to_specs(spec, block_out, tile):
+    if isinstance(spec, dict):
+        for k, v in block_out.items():
+            _write_block_to_specs(spec[k], v, tile)
+    elif spec is not None:
+        x0, x1, y0, y1 = tile
+        path, dtype, shape = spec
+        out = np.memmap(path, mode="r+", dtype=dtype, shape=shape)
+        if isinstance(block_out, torch.Tensor):
+            block_out = block_out.detach().cpu().numpy()
+        out[..., x0:x1, y0:y1] = block_out
+        out.flush()
+        del out
+
+
+def _init_block_worker(n_threads):
+    """Process-pool initializer: CPU only, with torch intra-op threads capped per worker."""
+    os.environ["SSQ_GPU"] = "0"
+    torch.set_num_threads(n_threads)
+
+
+def _tile_mask(mask, tile):
+    if mask is None:
+        return None
+    x0, x1, y0, y1 = tile
+    return mask[x0:x1, y0:y1]
+
+
+def _run_block(fn, slab, block_mask=None):
+    block_out = fn(slab)
+    if block_mask is not None:
+        block_out = mask_outputs(block_out, block_mask)
+    return block_out
+
+
+def _run_block_into_memmaps(fn, slab, tile, specs, block_mask=None):
+    _write_block_to_specs(specs, _run_block(fn, slab, block_mask), tile)
+    x0, x1, y0, y1 = tile
+    return (x1 - x0) * (y1 - y0)
+
+
+def block_tiles(shape, n_blocks, mask=None):
+    """(x0, x1, y0, y1) blocks of `n_blocks` row slabs, trimmed to the foreground of `mask`."""
+    X, Y = shape[-2:]
+    slabs = row_slabs(X, n_blocks)
+    if mask is None:
+        return [(x0, x1, 0, Y) for x0, x1 in slabs]
+    return mask_tiles(mask, slabs)
+
+
+def run_blockwise(fn, data, n_blocks, workers=1, mask=None, keep_on_device=False):
+    """Generator applying `fn` to row slabs of `data` (..., X, Y); yields progress per block and returns the stitched outputs.
+
+    workers > 1 runs the blocks in a process pool (`fn` must be picklable);
+    with a `mask`, background-only slabs are skipped and background outputs are 0.
+    """
+    X, Y = data.shape[-2:]
+    tiles = block_tiles(data.shape, n_blocks, mask)
+    if not tiles:
+        raise ValueError("The mask has no foreground pixels")
+    if workers > 1 and len(tiles) > 1:
+        return (yield from _run_blockwise_parallel(fn, data, tiles, workers, mask))
+    
+    outputs = None
+    allocated = {}
+    pixels_done = 0
+    start = time.time()
+    for i, tile in enumerate(tiles):
+        x0, x1, y0, y1 = tile
+        block_out = _run_block(fn, data[..., x0:x1, y0:y1], _tile_mask(mask, tile))
+        if outputs is None:
+            outputs = _allocate_like(block_out, X, Y, tile, allocated, zeros=mask is not None,
+                                     on_device=keep_on_device)
+        _write_block(outputs, block_out, tile, allocated)
+        pixels_done += (x1 - x0) * (y1 - y0)
+        yield progress_info(i + 1, len(tiles), pixels_done, start)
+    return outputs
+
+
+def _run_blockwise_parallel(fn, data, tiles, workers, mask=None):
+    """run_blockwise over a spawn-based process pool writing into shared memmaps.
+
+    The first block runs in-process to learn the output layout; the remaining
+    blocks are submitted at most 2 * workers at a time so lazy inputs are read
+    progressively. Workers write their slab straight into the memmapped outputs,
+    so results are never pickled back.
+    """
+    X, Y = data.shape[-2:]
+    start = time.time()
+    x0, x1, y0, y1 = tiles[0]
+    first = _run_block(fn, data[..., x0:x1, y0:y1], _tile_mask(mask, tiles[0]))
+    
+    memmap_dir = tempfile.mkdtemp(prefix="cellstream_blocks_")
+    allocated = {}
+    outputs = _allocate_like(first, X, Y, tiles[0], allocated, memmap_dir=memmap_dir)
+    _write_block(outputs, first, tiles[0], allocated)
+    specs = _memmap_specs(outputs, allocated)
+    del first
+    done, pixels_done = 1, (x1 - x0) * (y1 - y0)
+    yield progress_info(done, len(tiles), pixels_done, start)
+    
+    n_threads = max(1, (os.cpu_count() or 1) // workers)
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_block_worker,
+        initargs=(n_threads,),
+    )
+    todo = iter(tiles[1:])
+    pending = set()
+    try:
+        while True:
+            while len(pending) < 2 * workers:
+                tile = next(todo, None)
+                if tile is None:
+                    break
+                a, b, c, d = tile
+                slab = data[..., a:b, c:d]
+                if isinstance(slab, torch.Tensor):
+                    slab = slab.detach().cpu().numpy()
+                slab = np.ascontiguousarray(slab)  # pickles only this slab; reads lazy inputs
+                pending.add(executor.submit(_run_block_into_memmaps, fn, slab, tile, specs,
+                                            _tile_mask(mask, tile)))
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done += 1
+                pixels_done += future.result()
+                yield progress_info(done, len(tiles), pixels_done, start)
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        # The parent's mappings stay valid after the backing files are unlinked
+        for path in allocated.values():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        try:
+            os.rmdir(memmap_dir)
+        except OSError:
+            pass
+    return outputs
+
+
+def run_to_completion(job):
+    """Exhaust a block generator without a GUI and return its result."""
+    while True:
+        try:
+            next(job)
+        except StopIteration as stop:
+            return stop.value
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Small helpers shared by the widgets: device selection and zero-copy
+array adapters between napari layer data and torch.
+
+@author: coylelab @ UW-Madison
+"""
+
+import logging
+
+import numpy as np
+import torch
+import dask.array as da
+
+logger = logging.getLogger(__name__)
+
+
+def select_device(use_gpu=False):
+    """Pick CUDA, then MPS, then CPU; CPU unless use_gpu is set."""
+    if use_gpu==True:
+        if torch.cuda.is_available():
+            return torch.device("cuda")
+        elif torch.backends.mps.is_available():
+            return torch.device("mps")  # For Macs with M1/M2 GPUs
+        logger.info("No GPU detected; switching to CPU mode...")
+    return torch.device("cpu")
+
+
+class DeviceArray:
+    """Read-only array view of GPU tensors (optionally stacked along `axis`) that copies to host only what is indexed."""
+
+    def __init__(self, tensors, axis=None):
+        self.tensors = [tensors] if axis is None else list(tensors)
+        self.axis = axis
+        first = self.tensors[0]
+        shape = tuple(first.shape)
+        if axis is not None:
+            shape = shape[:axis] + (len(self.tensors),) + shape[axis:]
+        self.shape = shape
+        self.ndim = len(shape)
+        self.dtype = torch.empty((), dtype=first.dtype).numpy().dtype
+        self.device = first.device
+
+    @property
+    def nbytes(self):
+        return sum(t.element_size() * t.nelement() for t in self.tensors)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _full_index(self, index):
+        index = index if isinstance(index, tuple) else (index,)
+        if any(i is Ellipsis for i in index):
+            at = next(n for n, i in enumerate(index) if i is Ellipsis)
+            fill = (slice(None),) * (self.ndim - len(index) + 1)
+            index = index[:at] + fill + index[at + 1:]
+        return index + (slice(None),) * (self.ndim - len(index))
+
+    def on_device(self, index=Ellipsis):
+        """Tensor of `self[index]` on the device (stacking only the selected tensors)."""
+        if self.axis is None:
+            return self.tensors[0][index]
+        index = self._full_index(index)
+        rest = index[:self.axis] + index[self.axis + 1:]
+        picked = index[self.axis]
+        if isinstance(picked, (int, np.integer)):
+            return self.tensors[picked][rest]
+        parts = [t[rest] for t in self.tensors[picked]]
+        # the stacked axis moves by the number of leading axes indexed away
+        dropped = sum(isinstance(i, (int, np.integer)) for i in index[:self.axis])
+        return torch.stack(parts, dim=self.axis - dropped)
+
+    def downsampled(self, step):
+        """DeviceArray of every `step`-th pixel of the spatial axes (device views, no copy)."""
+        if self.axis is None:
+            return DeviceArray(self.tensors[0][..., ::step, ::step])
+        return DeviceArray([t[..., ::step, ::step] for t in self.tensors], self.axis)
+
+    def __getitem__(self, index):
+        return to_numpy(self.on_device(index))
+
+    def __array__(self, dtype=None):
+        arr = self[...]
+        return arr if dtype is None else arr.astype(dtype, copy=False)
+
+
+def host_or_device(t):
+    """numpy array of a CPU tensor (no copy); device tensors are wrapped in a DeviceArray."""
+    if isinstance(t, torch.Tensor) and t.device.type != "cpu":
+        return DeviceArray(t)
+    return to_numpy(t)
+
+
+def as_float32_array(data, index=Ellipsis, chunk_frames=16):
+    """float32 numpy view of `data[index]`, copying only when it has to.
+
+    Other dtypes and lazy arrays are read into one float32 buffer, `chunk_frames` frames at a time.
+    """
+    if isinstance(data, (torch.Tensor, DeviceArray)):
+        return to_numpy(as_float32_tensor(data, index))
+    if isinstance(data, np.ndarray):
+        src = data[index]
+        if src.dtype == np.float32 and all(stride >= 0 for stride in src.strides):
+            return src
+    elif isinstance(data, da.Array):
+        src = data[index]
+    else:
+        src = da.from_array(data, chunks=getattr(data, "chunks", None) or "auto")[index]
+    
+    out = np.empty(src.shape, dtype=np.float32)
+    if isinstance(src, da.Array):
+        da.store(src, out, lock=False)
+    elif src.ndim == 0:
+        out[...] = src
+    else:
+        for i in range(0, src.shape[0], chunk_frames):
+            out[i:i + chunk_frames] = src[i:i + chunk_frames]
+    return out
+
+
+def as_float32_tensor(data, index=Ellipsis):
+    """float32 torch tensor of `data[index]` sharing memory with `data` where possible.
+
+    float32 tensors and writable float32 numpy arrays pass through without
+    a copy (read-only ones, e.g. memmaps, are copied), DeviceArray data stays
+    on its device; everything else goes through as_float32_array.
+    """
+    if isinstance(data, DeviceArray):
+        data = data.on_device(index)
+        index = Ellipsis
+    if isinstance(data, torch.Tensor):
+        t = data[index]
+        return t if t.dtype == torch.float32 else t.float()
+    arr = as_float32_array(data, index)
+    if not arr.flags.writeable:
+        arr = arr.copy()  # e.g. read-only memmaps: cellstream may modify its input in place
+    return torch.from_numpy(arr)
+
+
+def to_numpy(t):
+    """numpy array of a result tensor (no copy for CPU tensors)."""
+    if isinstance(t, torch.Tensor):
+        return t.detach().cpu().numpy()
+    return np.asarray(t)
@@ -6,30 +6,41 @@
 import torch
 import matplotlib.pyplot as plt
 import numpy as np
-import nd2
-import tifffile
 import time
+import inspect
 import zarr
+import dask.array as da
 
 from qtpy.QtWidgets import (QWidget, QVBoxLayout, QPushButton, QLabel, 
                            QComboBox, QSpinBox, QCheckBox, QHBoxLayout,
                            QGroupBox, QDoubleSpinBox, QFormLayout,QFileDialog,
                            QScrollArea, QSplitter, QTreeWidget, QTreeWidgetItem,
-                           QFrame)
+                           QFrame, QProgressBar)
 
-from qtpy.QtCore import Qt, Signal
+from qtpy.QtCore import Qt, Signal, QTimer
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qtagg import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.figure import Figure
 from qtpy.QtWidgets import QSizePolicy
-
-
-from ssqueezepy import cwt
-
+from napari.layers import Labels, Shapes
+from napari.qt.threading import thread_worker
+from functools import partial
+
+from ._pixel_spectra import (SpectraCache, WaveletFilterBank,
+                             compute_roi_spectra, read_roi_traces,
+                             wavelet_key)
+from ._utils import select_device, host_or_device
+from ._display import build_pyramid, sample_contrast_limits, stack_channels
+from ._result_store import ResultStore, resolve_result_path
+from ._regions import shapes_mask_at
+from ._io import (read_image, write_to_zarr, write_dict_to_zarr_group,
+                  load_zarr_to_dict, make_compressor, open_result_store,
+                  describe_result_index, INDEX_KEY)
 from ._fft_widget import fft_gui_widget
 from ._cwt_widget import generate_cwt_features_widget
 from ._falsecolor_spectrum import false_color_widget
 from ._downsample_widget import downsample_gui_widget
+from ._batch_widget import batch_gui_widget
 
 import logging
 
@@ -56,6 +67,55 @@ WAVELET_PARAMS = {
     'hhhat': { "mu": (5,0,1000,1)
             }}
 
+@thread_worker
+def feature_job_worker(job):
+    """Run an FFT/CWT block generator in a worker thread, forwarding its progress and result."""
+    return (yield from job)
+
+def is_array_like(data):
+    """True for tensors, ndarrays and lazy arrays (zarr/dask) that napari can display."""
+    return isinstance(data, (torch.Tensor, np.ndarray)) or (
+        hasattr(data, "shape") and hasattr(data, "dtype") and hasattr(data, "__getitem__"))
+
+def base_level(layer):
+    """Full-resolution data of a layer (level 0 of a multiscale pyramid)."""
+    return layer.data[0] if getattr(layer, "multiscale", False) else layer.data
+
+def result_translate(result, ndim, time_axis=None):
+    """Layer translate placing a region-restricted result at its offset in the source image.
+
+    For layers with a time axis (`time_axis`), the first frame of the
+    region's time window is applied there as well.
+    """
+    attrs = result.get('_attrs') if isinstance(result, dict) else None
+    if not isinstance(attrs, dict) or attrs.get('translate') is None:
+        return None
+    translate = [0] * (ndim - 2) + list(attrs['translate'])
+    if time_axis is not None:
+        translate[time_axis] = attrs.get('time_offset', 0)
+    return translate
+
+# Pixel inspector ROI modes
+ROI_MODES = ["Pixel", "Neighborhood", "ROI layer region"]
+ROI_AVERAGING = {"Mean trace": "trace", "Mean spectrum": "spectrum"}
+
+# Zarr chunk layouts offered when writing results
+ZARR_CHUNK_LAYOUTS = {"Spatial tiles": "spatial", "Pixel time series": "pixel"}
+
+@thread_worker
+def result_spill_worker(store, spills):
+    """Write (key, result, path) spills of a ResultStore to its Zarr cache off the GUI thread."""
+    for spill in spills:
+        yield store.write_cache(*spill)
+
+@thread_worker
+def pixel_spectra_worker(data, roi, filter_bank, device, average):
+    """Read and transform one pixel/ROI off the GUI thread; yields between stages so quit() can abort."""
+    bounds, mask = roi
+    traces = read_roi_traces(data, bounds, mask, average=average)
+    yield
+    return compute_roi_spectra(traces, filter_bank, device=device, average=average)
+
 class AspectRatioPixmapLabel(QLabel):
     def __init__(self, pixmap, parent=None):
         super().__init__(parent)
@@ -87,15 +147,45 @@ class SpectralWidget(QWidget):
         self.toolbar = None
         self._axes = None
         self._n_channels = 0
+        self._plot_shape = None
+        self._time_lines = []
+        self._fft_lines = []
+        self._blit_background = None
         self._linking = False
         self.viewer.dims.events.current_step.connect(self.update_time_cursor) #time line
         self.last_update_time = 0  # store time of last update
         self.update_interval = .25  # seconds (5 Hz)
         
+        # Per-pixel spectra cache (display-only changes become a redraw)
+        self.spectra_cache = SpectraCache()
+        self._layer_versions = {}
+        self.viewer.layers.events.removed.connect(self._on_layer_removed)
+        self.filter_bank = None  # rebuilt lazily per (wavelet params, nv, T)
+        
+        # Background pixel computation: one running worker, newest request pending
+        self._pixel_worker = None
+        self._pending_pixel_request = None
+        self._pixel_request_id = 0
+        
+        # Hover inspection: throttled, coalesced to the newest mouse position
+        self._hover_connected = False
+        self._hover_request = None
+        self.last_hover_time = 0
+        self.hover_interval = .1  # seconds (10 Hz)
+        self._hover_timer = QTimer(self)
+        self._hover_timer.setSingleShot(True)
+        self._hover_timer.timeout.connect(self._flush_hover_request)
+        self.device = select_device(self.use_gpu)
+        
         # Feature dictionary tree results store
         self.cwt_count = 0
         self.fft_count = 0
-        self.results_dict = {}
+        # Results are held once (tree and layers share the arrays) and spilled
+        # to a temporary Zarr cache beyond the RAM budget
+        self.result_store = ResultStore(max_bytes=8 * 1024**3, on_spill=self._on_result_spilled)
+        
+        # File handles backing lazily loaded layers (closed in closeEvent)
+        self._open_files = []
         
         # Default settings
         self.wavelet = "gmw"
@@ -151,9 +241,54 @@ class SpectralWidget(QWidget):
         cwt_layout.addWidget(self.cwt_gui.native)
         cwt_group.setLayout(cwt_layout)
         
+        #batch widget
+        self.batch_gui = batch_gui_widget
+        self.batch_gui.called.connect(self.handle_batch_result)
+        
+        batch_group = QGroupBox("     Batch processing")
+        batch_group.setCheckable(True)
+        batch_group.setChecked(False)
+        self.batch_gui.native.setVisible(False)
+        batch_group.toggled.connect(self.batch_gui.native.setVisible)
+        
+        batch_layout = QVBoxLayout()
+        batch_layout.addWidget(self.batch_gui.native)
+        batch_group.setLayout(batch_layout)
+        
+        # Feature job progress (FFT/CWT generation runs in a worker thread)
+        self.feature_worker = None
+        self.feature_job_name = ""
+        self.feature_progress = QProgressBar()
+        self.feature_progress.setRange(0, 1)
+        self.feature_progress.setValue(0)
+        self.cancel_feature_button = QPushButton("Cancel")
+        self.cancel_feature_button.setEnabled(False)
+        self.cancel_feature_button.setToolTip("Stop the running feature job after the current block")
+        self.cancel_feature_button.clicked.connect(self.cancel_feature_job)
+        self.feature_progress_label = QLabel("No feature job running")
+        self.feature_progress_label.setStyleSheet("font-size: 10px; color: #aaa;")
+        
+        progress_panel = QWidget()
+        progress_layout = QVBoxLayout(progress_panel)
+        progress_layout.setContentsMargins(0, 0, 0, 0)
+        progress_row = QHBoxLayout()
+        progress_row.addWidget(self.feature_progress)
+        progress_row.addWidget(self.cancel_feature_button)
+        progress_layout.addLayout(progress_row)
+        progress_layout.addWidget(self.feature_progress_label)
+        
+        self.multiscale_check = QCheckBox("Multiscale feature layers")
+        self.multiscale_check.setChecked(False)
+        self.multiscale_check.setToolTip("Add large feature results as lazy image pyramids so panning and zooming stay responsive")
+        progress_layout.addWidget(self.multiscale_check)
+        
         # Load image button
         self.load_button = QPushButton("Load Image")
         self.load_button.clicked.connect(self.open_file_dialog)
+        
+        self.lazy_load_check = QCheckBox("Lazy load (memory-mapped)")
+        self.lazy_load_check.setChecked(False)
+        self.lazy_load_check.setToolTip("Read slices from disk on demand instead of loading the whole stack into RAM")
 
         # Save plots button
         self.save_plot_button = QPushButton("Save Plot")
@@ -167,10 +302,13 @@ class SpectralWidget(QWidget):
         left_panel.setLayout(left_layout)
         
         left_layout.addWidget(self.load_button)
+        left_layout.addWidget(self.lazy_load_check)
         left_layout.addSpacing(32)
         left_layout.addWidget(self.controls_group)
         left_layout.addWidget(fft_group)
         left_layout.addWidget(cwt_group)
+        left_layout.addWidget(batch_group)
+        left_layout.addWidget(progress_panel)
         
         scroll_area = QScrollArea()
         scroll_area.setWidgetResizable(True)
@@ -201,6 +339,43 @@ class SpectralWidget(QWidget):
         buttons_layout.addWidget(self.load_zarr_button)
         
         results_layout.addLayout(buttons_layout)
+        
+        # Result memory: RAM budget before least recently used results spill to disk
+        store_layout = QHBoxLayout()
+        self.release_result_button = QPushButton("Release Result")
+        self.release_result_button.setToolTip("Remove the selected result, its layers and its cached data")
+        self.release_result_button.clicked.connect(self.release_selected_result)
+        store_layout.addWidget(self.release_result_button)
+        store_layout.addWidget(QLabel("RAM budget (GB):"))
+        self.result_budget_spin = QDoubleSpinBox()
+        self.result_budget_spin.setRange(0.0, 1024.0)
+        self.result_budget_spin.setDecimals(1)
+        self.result_budget_spin.setValue(self.result_store.max_bytes / 1024**3)
+        self.result_budget_spin.setToolTip(
+            "Results beyond this budget of host RAM are written to a local Zarr cache, least recently used "
+            "first (results kept on the GPU do not count against it)"
+        )
+        self.result_budget_spin.editingFinished.connect(self._on_result_budget_changed)
+        store_layout.addWidget(self.result_budget_spin)
+        results_layout.addLayout(store_layout)
+        
+        # Zarr write options
+        zarr_options_layout = QHBoxLayout()
+        zarr_options_layout.addWidget(QLabel("Chunks:"))
+        self.zarr_chunks_combo = QComboBox()
+        for label, layout in ZARR_CHUNK_LAYOUTS.items():
+            self.zarr_chunks_combo.addItem(label, layout)
+        self.zarr_chunks_combo.setToolTip(
+            "Spatial tiles: fast image browsing. Pixel time series: fast per-pixel trace reads."
+        )
+        zarr_options_layout.addWidget(self.zarr_chunks_combo)
+        zarr_options_layout.addWidget(QLabel("Level:"))
+        self.zarr_clevel_spin = QSpinBox()
+        self.zarr_clevel_spin.setRange(0, 9)
+        self.zarr_clevel_spin.setValue(5)
+        self.zarr_clevel_spin.setToolTip("Blosc zstd compression level (0 = uncompressed)")
+        zarr_options_layout.addWidget(self.zarr_clevel_spin)
+        results_layout.addLayout(zarr_options_layout)
 
         ### Main layout using splitter ###
         splitter = QSplitter(Qt.Horizontal)
@@ -286,22 +461,17 @@ class SpectralWidget(QWidget):
         if file_path:
             self.load_image(file_path)
     
-    def load_image(self, path: str):
-        logger.info(f"Loading image from: {path}")
-        *iname, iext = path.split('.')
-        if iext == 'nd2':
-            image = nd2.imread(path)
-        elif iext == 'tif':
-            image = tifffile.imread(path)
-        else:
+    def load_image(self, path: str, lazy=None):
+        if lazy is None:
+            lazy = self.lazy_load_check.isChecked()
+        logger.info(f"Loading image from: {path} (lazy={lazy})")
+        try:
+            image, name = read_image(path, lazy=lazy, open_files=self._open_files)
+        except ValueError:
             logger.error("Invalid type")
             return
-        #check dimension -- insert dummy channel dimension if need by
-        if image.ndim==3:
-            image=np.expand_dims(image,axis=1)
-            logger.info("Inserting channel dimension...")
         
-        self.viewer.add_image(image, name=iname[-1])
+        self.viewer.add_image(image, name=name)
         return
     
     def save_figure(self):
@@ -320,8 +490,24 @@ class SpectralWidget(QWidget):
             self.canvas.figure.savefig(file_path, bbox_inches='tight', dpi=300)
             logger.info(f"Figure saved to: {file_path}")
     
+    def add_feature_layer(self, data, **kwargs):
+        """Add a feature array to the viewer with sampled contrast limits.
+        
+        Contrast limits come from a few random planes instead of napari's
+        full-array autoscale. With "Multiscale feature layers" checked, arrays
+        larger than one pyramid tile are added as lazy strided pyramids.
+        """
+        levels = build_pyramid(data) if self.multiscale_check.isChecked() else [data]
+        kwargs.setdefault("contrast_limits", sample_contrast_limits(levels[-1]))
+        if len(levels) > 1:
+            return self.viewer.add_image(levels, multiscale=True, **kwargs)
+        return self.viewer.add_image(data, **kwargs)
+    
     ###FFT widget components
     def handle_fft_result(self, result):
+        if inspect.isgenerator(result):
+            self.start_feature_job(result, self.handle_fft_result, "FFT")
+            return
         if not isinstance(result, dict):
             logger.error("FFT did not return a valid result")
             return
@@ -333,15 +519,19 @@ class SpectralWidget(QWidget):
         root_item.setText(0, root_name)
         root_item.setText(1, f"Dict ({len(result)} keys)")
         self.populate_tree(root_item, result)
-        self.results_dict[id(root_item)] = result
+        result = self.result_store.add(id(root_item), result)
+        self.spill_over_budget(keep=(id(root_item),))
 
         for key, data in result.items():
             if key == '_attrs':
                 continue
             name = f"FFT_{key}"
-            if isinstance(data, torch.Tensor):
-                data = data.cpu().numpy()
-            self.viewer.add_image(data, name=name)
+            if isinstance(data, zarr.Array):
+                data = da.from_zarr(data)
+            elif isinstance(data, torch.Tensor):
+                data = host_or_device(data)  # GPU-resident results are copied per displayed slice
+            self.add_feature_layer(data, name=name, translate=result_translate(result, data.ndim),
+                                   metadata={"result_key": id(root_item), "result_path": (key,)})
 
     ###CWT widget components
     def propagate_wavelet_params_to_cwt_widget(self):
@@ -353,6 +543,11 @@ class SpectralWidget(QWidget):
         self.cwt_gui.wavelet_parameters.value=wavelet_params
 
     def handle_cwt_result(self,results):
+        if inspect.isgenerator(results):
+            self.start_feature_job(results, self.handle_cwt_result, "CWT")
+            return
+        if results is None:
+            return
         # Add to results tree
         self.cwt_count += 1
         wavelet_name = self.cwt_gui.wavelet_choice.value
@@ -360,43 +555,106 @@ class SpectralWidget(QWidget):
         root_name = f"CWT_Result_{self.cwt_count} (wavelet={wavelet_name}, nv={nv_val})"
         root_item = QTreeWidgetItem(self.results_tree)
         root_item.setText(0, root_name)
-        root_item.setText(1, f"Dict ({len(results)} channels)")
+        n_channels = len([k for k, v in results.items() if k != '_attrs' and isinstance(v, dict)])
+        root_item.setText(1, f"Dict ({n_channels} channels)")
         self.populate_tree(root_item, results)
-        self.results_dict[id(root_item)] = results
+        results = self.result_store.add(id(root_item), results)
+        self.spill_over_budget(keep=(id(root_item),))
 
-        #reorganize spectra
-        consolidated = {}
-        for channel_key, ch_data in results.items():
-            if channel_key == '_attrs':
-                continue
-            for key, arr in ch_data.items():
-                if key not in consolidated:
-                    consolidated[key] = []
-                if isinstance(arr, torch.Tensor):
-                    arr = arr.detach().cpu().numpy()
-                elif hasattr(arr, "numpy"):
-                    arr = arr.numpy()
-                consolidated[key].append(arr)
-        
-        #convert to array
-        for key in consolidated:
-            consolidated[key] = np.stack(consolidated[key], axis=0)
+        attrs = results.get('_attrs')
+        if isinstance(attrs, dict) and attrs.get('layout') == "table":
+            n_pixels = len(results.get('pixel_coords', ()))
+            logger.info(f"Sparse CWT pixel table for {n_pixels} pixels added to Results History")
+            return
+
+        # Lazy per-feature channel stacks over the arrays held by the results tree (no copy)
+        consolidated = stack_channels(results, axis=1)
     
         # Add results to Napari viewer
         for feature, array in consolidated.items():
             layer_name = f"{feature}"
-            self.viewer.add_image(
-                array.swapaxes(0,1),  #  organize as (T, num_filter_banks "Z", C, X, Y)
+            self.add_feature_layer(
+                array,  #  organize as (T, num_filter_banks "Z", C, X, Y)
                 name=layer_name,
                 scale=[20,1,1],
-                metadata={"source": "cwt", "feature": feature}
+                translate=result_translate(results, array.ndim, time_axis=0),
+                metadata={"source": "cwt", "feature": feature, "result_key": id(root_item)}
             )
 
+    ###Batch widget components
+    def handle_batch_result(self, job):
+        self.start_feature_job(job, self._on_batch_finished, "Batch")
+    
+    def _on_batch_finished(self, status):
+        failed = [path for path, state in status.items() if state != "done"]
+        self.feature_progress_label.setText(
+            f"Batch finished: {len(status) - len(failed)} done, {len(failed)} failed"
+        )
+        for path in failed:
+            logger.error(f"Batch failed on {path}; see the manifest for details")
+
+    ### Background feature jobs
+    def start_feature_job(self, job, on_result, name):
+        """Run a job generator in a worker thread, reporting its progress and passing the result to `on_result`.
+
+        The FFT/CWT, downsample and batch widgets return their jobs as
+        generators that yield progress_info dicts and return the result, so
+        they run here off the GUI thread and can be cancelled between blocks.
+        """
+        if self.feature_worker is not None:
+            job.close()
+            from qtpy.QtWidgets import QMessageBox
+            QMessageBox.warning(self, "Job Running", "A feature job is already running. Cancel it or wait for it to finish.")
+            return
+        
+        worker = feature_job_worker(job)
+        worker.yielded.connect(self.on_feature_progress)
+        worker.returned.connect(on_result)
+        worker.errored.connect(self._on_feature_job_error)
+        worker.aborted.connect(lambda: self.feature_progress_label.setText(f"{name} job cancelled"))
+        worker.finished.connect(self._on_feature_job_finished)
+        
+        self.feature_worker = worker
+        self.feature_job_name = name
+        self.feature_progress.setRange(0, 0)  # busy indicator until the first block reports
+        self.feature_progress_label.setText(f"{name} job running...")
+        self.feature_progress_label.setToolTip("")
+        self.cancel_feature_button.setEnabled(True)
+        worker.start()
+    
+    def on_feature_progress(self, info):
+        if "plan" in info:
+            self.feature_progress_label.setText(f"{self.feature_job_name}: {info['plan']}")
+            self.feature_progress_label.setToolTip(f"Auto block plan: {info['plan']}")
+            return
+        self.feature_progress.setRange(0, info["total"])
+        self.feature_progress.setValue(info["done"])
+        self.feature_progress_label.setText(
+            f"{self.feature_job_name}: {info.get('unit', 'block')} {info['done']}/{info['total']} - "
+            f"{info['pixels_per_s']:,.0f} px/s - ETA {info['eta']:.0f} s"
+        )
+    
+    def cancel_feature_job(self):
+        if self.feature_worker is not None:
+            self.feature_worker.quit()
+            self.cancel_feature_button.setEnabled(False)
+            self.feature_progress_label.setText("Cancelling after the current block...")
+    
+    def _on_feature_job_error(self, e):
+        logger.error(f"{self.feature_job_name} feature job failed: {e}")
+        self.feature_progress_label.setText(f"{self.feature_job_name} job failed: {e}")
+    
+    def _on_feature_job_finished(self):
+        self.feature_worker = None
+        self.cancel_feature_button.setEnabled(False)
+        if self.feature_progress.maximum() == 0:
+            self.feature_progress.setRange(0, 1)
+
     ### False-color widget components
     def handle_false_color_result(self, result):
        
         #add downsampled
-        self.viewer.add_image(
+        self.add_feature_layer(
             result,  
             name="False colored",
             scale=[20,1,1],
@@ -405,12 +663,21 @@ class SpectralWidget(QWidget):
         return
 
     def handle_downsample_result(self, result):
+        source = self.viewer.layers.selection.active
+        if inspect.isgenerator(result):
+            # chunked downsampling runs in a worker; the source layer is replaced once it is done
+            self.start_feature_job(result, partial(self._replace_with_downsampled, source), "Downsample")
+            return
+        self._replace_with_downsampled(source, result)
+
+    def _replace_with_downsampled(self, source, result):
         #remove original
-        active_layer = self.viewer.layers.selection.active
-        if active_layer is not None:
-            self.viewer.layers.remove(active_layer)
+        if source is not None and source in self.viewer.layers:
+            self.viewer.layers.remove(source)
+        if isinstance(result, zarr.Array):
+            result = da.from_zarr(result)
 
-        self.viewer.add_image(
+        self.add_feature_layer(
             result,  
             name="False colored",
             scale=[20,1,1],
@@ -501,6 +768,45 @@ class SpectralWidget(QWidget):
         self.track_cursor_check.setToolTip("Uncheck to disable plot redraws while scrubbing the movie")
         controls_layout.addWidget(self.track_cursor_check)
         
+        # ROI selection: single pixel, k x k neighborhood, or a Labels/Shapes region
+        roi_group = QGroupBox("Region")
+        roi_layout = QFormLayout()
+        self.roi_mode_combo = QComboBox()
+        self.roi_mode_combo.addItems(ROI_MODES)
+        self.roi_mode_combo.currentTextChanged.connect(self.roi_changed)
+        roi_layout.addRow(QLabel("Mode:"), self.roi_mode_combo)
+        
+        self.roi_size_spin = QSpinBox()
+        self.roi_size_spin.setRange(1, 101)
+        self.roi_size_spin.setSingleStep(2)
+        self.roi_size_spin.setValue(5)
+        self.roi_size_spin.valueChanged.connect(self.roi_changed)
+        roi_layout.addRow(QLabel("Size (k x k):"), self.roi_size_spin)
+        
+        self.roi_layer_combo = QComboBox()
+        self.roi_layer_combo.setToolTip("Labels layer (region under the click) or Shapes layer (shapes containing the click)")
+        self.roi_layer_combo.currentTextChanged.connect(self.roi_changed)
+        roi_layout.addRow(QLabel("ROI layer:"), self.roi_layer_combo)
+        
+        self.roi_average_combo = QComboBox()
+        self.roi_average_combo.addItems(list(ROI_AVERAGING.keys()))
+        self.roi_average_combo.setToolTip("Transform the mean trace, or average per-pixel spectra (Welch-style)")
+        self.roi_average_combo.currentTextChanged.connect(self.roi_changed)
+        roi_layout.addRow(QLabel("Average:"), self.roi_average_combo)
+        
+        roi_group.setLayout(roi_layout)
+        controls_layout.addWidget(roi_group)
+        self.update_roi_layer_choices()
+        self.viewer.layers.events.inserted.connect(self.update_roi_layer_choices)
+        self.viewer.layers.events.removed.connect(self.update_roi_layer_choices)
+        
+        # Hover inspection toggle
+        self.hover_check = QCheckBox("Inspect on Hover")
+        self.hover_check.setChecked(False)
+        self.hover_check.setToolTip("Update plots for the pixel under the mouse (no Shift+Click needed)")
+        self.hover_check.toggled.connect(self.hover_mode_changed)
+        controls_layout.addWidget(self.hover_check)
+        
         # Refresh button
         self.refresh_button = QPushButton("Refresh Plots")
         self.refresh_button.clicked.connect(self.refresh_plots)
@@ -551,19 +857,36 @@ class SpectralWidget(QWidget):
     ### handle dynamic updating of plots and setting cwt_params
     def wavelet_changed(self, value):
         self.wavelet = value
+        self.filter_bank = None
         self.create_wavelet_params_controls()
         self.refresh_plots()
         self.propagate_wavelet_params_to_cwt_widget() # propagate params to CWT_widget
 
     def param_changed(self, value):
+        self.filter_bank = None
         self.refresh_plots()
         self.propagate_wavelet_params_to_cwt_widget()
 
     def nv_changed(self, value):
         self.nv = value
+        self.filter_bank = None
         self.refresh_plots()
         self.propagate_wavelet_params_to_cwt_widget()
     
+    def roi_changed(self, value=None):
+        self.refresh_plots()
+    
+    def update_roi_layer_choices(self, event=None):
+        """List the viewer's Labels and Shapes layers as ROI sources."""
+        current = self.roi_layer_combo.currentText()
+        names = [layer.name for layer in self.viewer.layers if isinstance(layer, (Labels, Shapes))]
+        self.roi_layer_combo.blockSignals(True)
+        self.roi_layer_combo.clear()
+        self.roi_layer_combo.addItems(names)
+        if current in names:
+            self.roi_layer_combo.setCurrentText(current)
+        self.roi_layer_combo.blockSignals(False)
+    
     def zscore_changed(self, state):
         self.do_plot_zscore = (state == 2)  # 2 is checked
         self.refresh_plots()
@@ -691,6 +1014,21 @@ class SpectralWidget(QWidget):
                 self.cid = None
             self.status_label.setText("Status: INACTIVE - Click button to activate")
             self.activate_button.setText("Activate Pixel Inspector")
+        self.set_hover_callback(active and self.hover_check.isChecked())
+
+    def hover_mode_changed(self, enabled):
+        self.set_hover_callback(enabled and self.activate_button.isChecked())
+
+    def set_hover_callback(self, enabled):
+        """Add or remove on_hover from the viewer's mouse-move callbacks."""
+        if enabled and not self._hover_connected:
+            self.viewer.mouse_move_callbacks.append(self.on_hover)
+            self._hover_connected = True
+        elif not enabled and self._hover_connected:
+            self.viewer.mouse_move_callbacks.remove(self.on_hover)
+            self._hover_connected = False
+            self._hover_timer.stop()
+            self._hover_request = None
 
     def update_time_cursor(self, event=None):
         if self.canvas is None or not hasattr(self, "time_cursor_lines"):
@@ -710,7 +1048,7 @@ class SpectralWidget(QWidget):
         for line in self.time_cursor_lines:
             line.set_xdata([current_t])
     
-        self.canvas.draw_idle()
+        self.blit_time_cursors()
         self.last_update_time = now
     
     def on_click(self, viewer, event):
@@ -739,10 +1077,42 @@ class SpectralWidget(QWidget):
         except Exception as e:
             logger.error(f"Error processing click: {e}")
 
+    def on_hover(self, viewer, event):
+        """Inspect the pixel under the mouse, at most once per hover_interval."""
+        layer = viewer.layers.selection.active
+        if layer is None:
+            return
+        x, y = map(int, layer.world_to_data(event.position)[-2:])
+        X, Y = base_level(layer).shape[-2:]
+        if not (0 <= x < X and 0 <= y < Y):
+            return
+        if (layer, x, y) == (self.last_layer, self.last_x, self.last_y):
+            return
+        
+        # Only the newest position is kept; older pending ones are dropped
+        self._hover_request = (layer, x, y)
+        wait = self.hover_interval - (time.time() - self.last_hover_time)
+        if wait <= 0:
+            self._flush_hover_request()
+        elif not self._hover_timer.isActive():
+            self._hover_timer.start(int(wait * 1000))
+
+    def _flush_hover_request(self):
+        if self._hover_request is None:
+            return
+        layer, x, y = self._hover_request
+        self._hover_request = None
+        self.last_hover_time = time.time()
+        self.last_layer, self.last_x, self.last_y = layer, x, y
+        try:
+            self.process_pixel(layer, x, y)
+        except Exception as e:
+            logger.error(f"Error processing hover: {e}")
+
     def process_pixel(self, layer, x, y):
         """Process and display data for a single pixel"""
-        # Get and reshape data
-        data = layer.data
+        # Get and reshape data (pixels are read from the full-resolution level)
+        data = base_level(layer)
         if data.ndim == 3:
             data = data[:, np.newaxis, ...]  # Add channel dimension
         T, C, X, Y = data.shape
@@ -751,12 +1121,124 @@ class SpectralWidget(QWidget):
         if not (0 <= x < X and 0 <= y < Y):
             logger.warning(f"Coordinates out of bounds: ({x}, {y})")
             return
+        
+        # Every request supersedes older ones ("latest click wins")
+        self._pixel_request_id += 1
+        roi = self.get_roi(X, Y, x, y)
+        if roi is None:
+            return
+        bounds, mask, roi_key = roi
+        average = ROI_AVERAGING[self.roi_average_combo.currentText()]
+        wavelet_tuple = self.get_wavelet_tuple()
+        key = self.pixel_cache_key(layer, x, y, wavelet_tuple) + (roi_key, average)
+        spectra = self.spectra_cache.get(key)
+        if spectra is not None:
+            self._pending_pixel_request = None
+            self.plot_spectra(spectra, wavelet_tuple)
+            return
+        
+        # Cache miss: extract and transform all channels in a worker thread
+        self._pending_pixel_request = (self._pixel_request_id, key, data, (bounds, mask), average, wavelet_tuple)
+        if self._pixel_worker is not None:
+            self._pixel_worker.quit()  # pending request starts once it stops
+            return
+        self._start_pixel_worker()
+
+    def _start_pixel_worker(self):
+        request_id, key, data, roi, average, wavelet_tuple = self._pending_pixel_request
+        self._pending_pixel_request = None
+        filter_bank = self.get_filter_bank(wavelet_tuple, data.shape[0])
+        
+        worker = pixel_spectra_worker(data, roi, filter_bank, self.device, average)
+        worker.returned.connect(partial(self._on_pixel_spectra_returned, request_id, key, wavelet_tuple))
+        worker.errored.connect(lambda e: logger.error(f"Error computing pixel spectra: {e}"))
+        worker.finished.connect(self._on_pixel_worker_finished)
+        self._pixel_worker = worker
+        worker.start()
+
+    def _on_pixel_spectra_returned(self, request_id, key, wavelet_tuple, spectra):
+        if key[1] == self._layer_versions.get(key[0]):
+            self.spectra_cache.put(key, spectra)
+        if request_id == self._pixel_request_id:
+            self.plot_spectra(spectra, wavelet_tuple)
+        else:
+            logger.debug("Discarding spectra of a superseded pixel request")
+
+    def _on_pixel_worker_finished(self):
+        self._pixel_worker = None
+        if self._pending_pixel_request is not None:
+            self._start_pixel_worker()
+
+    def plot_spectra(self, spectra, wavelet_tuple):
+        """Draw pixel spectra, updating the existing figure in place when its layout still fits."""
+        C, T = spectra["ts"].shape
+        rebuild = self.canvas is None or self._plot_shape != (C, T)
+        if rebuild:
+            self.build_figure(C, T)
+        
+        self.cwt_magnitudes = []
+        self.fmax = min(self.fft_gui.max_bin.value, spectra["fft"].shape[-1]) #adjust powerspectrum
+        
+        for c in range(C):
+            # Time domain plot
+            logger.debug("Plotting time domain")
+            ts = spectra["ts"][c]
+            self._time_lines[c].set_data(np.arange(T), ts)
+            
+            logger.debug("Plotting freq domain")
+            # Frequency domain plot
+            fft = spectra["fft"][c]
             
+            if self.do_plot_zscore:
+                fft_mean=np.mean(fft)
+                fft_std=np.std(fft)
+                fft = (fft-fft_mean)/fft_std
+            
+            self._fft_lines[c].set_data(np.arange(self.fmax), fft[:self.fmax])
+            self.time_cursor_lines[3 * c + 1].set_xdata([min(self.current_time_index, self.fmax)])
+            
+            for row in (0, 1):
+                self._axes[row, c].relim()
+                self._axes[row, c].autoscale_view()
+            
+            # CWT plot
+            logger.debug("Plotting cwt domain")
+            cwt_mag = spectra["cwt"][c]
+
+            if self.do_plot_zscore:
+                cwt_mag_mean=np.mean(cwt_mag,axis=0)
+                cwt_mag_std=np.std(cwt_mag,axis=0)
+                cwt_mag=(cwt_mag-cwt_mag_mean)/cwt_mag_std
+           
+            logger.debug("Finalizing plots...")
+            im = self.spectrogram_images[c]
+            im.set_data(cwt_mag)
+            im.set_extent((-0.5, T - 0.5, -0.5, cwt_mag.shape[0] - 0.5))
+            self.cwt_magnitudes.append(cwt_mag)
+            ax = self._axes[2, c]
+            ax.set_title(f"CWT: {wavelet_tuple[0]}")
+            ax.set_xlim(-0.5, T - 0.5)
+            ax.set_ylim(-0.5, cwt_mag.shape[0] - 0.5)
+        
+        # Apply current contrast settings to spectrograms
+        self.apply_contrast_from_mode()
+        
+        if rebuild:
+            self.canvas.figure.tight_layout()
+            self.canvas.draw()
+        else:
+            self.canvas.draw_idle()
+
+    def build_figure(self, C, T):
+        """Create canvas, toolbar, axes and the artists that plot_spectra updates in place."""
         # Clear tracking lists (fixes memory leak of orphaned Line2D references)
         self.time_cursor_lines = []
         self.spectrogram_images = []
         self.cwt_magnitudes = []
+        self._time_lines = []
+        self._fft_lines = []
         self._axes = None
+        self._blit_background = None
         
         # Clear previous plot and toolbar
         if self.canvas:
@@ -774,84 +1256,39 @@ class SpectralWidget(QWidget):
         self.canvas = FigureCanvas(fig)
         self.canvas.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding) #dynamic layout
         self.plot_container.layout().addWidget(self.canvas)
+        self.canvas.mpl_connect('draw_event', self._on_canvas_draw)
         
         # Add navigation toolbar for interactive zoom/pan
         self.toolbar = NavigationToolbar(self.canvas, self.plot_container)
         self.plot_container.layout().addWidget(self.toolbar)
         
         # Create subplots: 3 rows (time, FFT, CWT) x C columns
-        if C > 1:
-            axes = fig.subplots(3, C, squeeze=False)
-        else:
-            axes = fig.subplots(3, 1, squeeze=False)
+        axes = fig.subplots(3, C, squeeze=False)
         
         for c in range(C):
-            # Extract and normalize time series
-            ts = data[:, c, x, y].astype(np.float64)
-            ts -= np.mean(ts)
-            
-            # Time domain plot
-            logger.debug("Plotting time domain")
-            ax = axes[0, c] if C > 1 else axes[0, 0]
-            ax.clear()
-            ax.plot(ts)
+            # Cursors are animated so update_time_cursor can blit them
+            ax = axes[0, c]
+            line, = ax.plot([], [])
+            self._time_lines.append(line)
             ax.set_title(f"Channel {c} - Time Domain" if C > 1 else "Time Domain")
             ax.set_xlabel("Time")
-            
-            cursor = ax.axvline(self.current_time_index, color='red', linestyle='dotted')
+            cursor = ax.axvline(self.current_time_index, color='red', linestyle='dotted', animated=True)
             self.time_cursor_lines.append(cursor)
-
-            logger.debug("Plotting freq domain")
-            # Frequency domain plot
-            ax = axes[1, c] if C > 1 else axes[1, 0]
-            ax.clear()
-            fft = np.abs(np.fft.rfft(ts))
-            
-            if self.do_plot_zscore:
-                fft_mean=np.mean(fft)
-                fft_std=np.std(fft)
-                fft = (fft-fft_mean)/fft_std
             
-            self.fmax=min(self.fft_gui.max_bin.value, fft.shape[0]) #adjust powerspectrum
-            
-            ax.plot(fft[:self.fmax],color='#FF91A4')
+            ax = axes[1, c]
+            line, = ax.plot([], [], color='#FF91A4')
+            self._fft_lines.append(line)
             ax.set_title("Frequency Domain")
             ax.set_xlabel("FFT bin number")
-            
-            cursor = ax.axvline(min(self.current_time_index,self.fmax), color='red', linestyle='dotted')
+            cursor = ax.axvline(self.current_time_index, color='red', linestyle='dotted', animated=True)
             self.time_cursor_lines.append(cursor)
             
-
-            # CWT plot
-            ax = axes[2, c] if C > 1 else axes[2, 0]
-            ax.clear()
-            
-            # Get wavelet tuple with current parameters
-            wavelet_tuple = self.get_wavelet_tuple()
-            
-            logger.debug("Plotting cwt domain")
-            # Compute CWT with the selected wavelet and parameters
-            Wx, _ = cwt(ts, wavelet=wavelet_tuple, nv=self.nv)
-
-            if isinstance(Wx, torch.Tensor):
-                cwt_mag = Wx.abs().cpu().numpy()
-            elif isinstance(Wx, np.ndarray):
-                cwt_mag = np.abs(Wx)
-
-            if self.do_plot_zscore:
-                cwt_mag_mean=np.mean(cwt_mag,axis=0)
-                cwt_mag_std=np.std(cwt_mag,axis=0)
-                cwt_mag=(cwt_mag-cwt_mag_mean)/cwt_mag_std
-           
-            logger.debug("Finalizing plots...")
-            im = ax.imshow(cwt_mag, aspect='auto', origin='lower', cmap='viridis')
+            ax = axes[2, c]
+            im = ax.imshow(np.zeros((1, T)), aspect='auto', origin='lower', cmap='viridis')
             self.spectrogram_images.append(im)
-            self.cwt_magnitudes.append(cwt_mag)
-            ax.set_title(f"CWT: {wavelet_tuple[0]}")
             ax.set_xlabel("Time")
             ax.set_ylabel("Scale")
-            
-            cursor = ax.axvline(self.current_time_index, color='red', linestyle='dotted')
+            cursor = ax.axvline(self.current_time_index, color='red', linestyle='dotted', animated=True)
             self.time_cursor_lines.append(cursor)
             
             #fig.colorbar(im, ax=ax)
@@ -859,15 +1296,107 @@ class SpectralWidget(QWidget):
         # Store axes reference and link time/CWT x-axes across channels
         self._axes = axes
         self._n_channels = C
+        self._plot_shape = (C, T)
         for c in range(C):
             for row in range(3):  # all rows: time, FFT, CWT — linked across channels
                 axes[row, c].callbacks.connect('xlim_changed', self._on_xlim_changed)
+
+    def _on_canvas_draw(self, event):
+        """Grab the background after each full draw, then overlay the animated cursors."""
+        fig = self.canvas.figure
+        self._blit_background = self.canvas.copy_from_bbox(fig.bbox)
+        for line in self.time_cursor_lines:
+            fig.draw_artist(line)
+
+    def blit_time_cursors(self):
+        """Redraw only the cursor lines over the cached background."""
+        if self._blit_background is None:
+            self.canvas.draw_idle()
+            return
+        fig = self.canvas.figure
+        self.canvas.restore_region(self._blit_background)
+        for line in self.time_cursor_lines:
+            fig.draw_artist(line)
+        self.canvas.blit(fig.bbox)
+
+    def get_roi(self, X, Y, x, y):
+        """Return (bounds, mask, roi_key) of the current ROI mode around (x, y), or None.
+
+        bounds are (x0, x1, y0, y1) of the slab to read; mask selects pixels
+        within it (None = all); roi_key identifies the region in cache keys.
+        """
+        mode = self.roi_mode_combo.currentText()
+        if mode == "Neighborhood":
+            half = self.roi_size_spin.value() // 2
+            bounds = (max(x - half, 0), min(x + half + 1, X),
+                      max(y - half, 0), min(y + half + 1, Y))
+            return bounds, None, (mode, half)
+        if mode != "ROI layer region":
+            return (x, x + 1, y, y + 1), None, (mode,)
         
-        # Apply current contrast settings to spectrograms
-        self.apply_contrast_from_mode()
-            
-        fig.tight_layout()
-        self.canvas.draw()
+        name = self.roi_layer_combo.currentText()
+        if name not in self.viewer.layers:
+            logger.warning("No Labels/Shapes layer selected for the ROI")
+            return None
+        roi_layer = self.viewer.layers[name]
+        if isinstance(roi_layer, Labels):
+            labels = base_level(roi_layer)
+            # leading (non-spatial) axes follow the viewer's current step
+            plane = np.asarray(labels[tuple(self.viewer.dims.current_step[-labels.ndim:-2])])
+            if plane.shape != (X, Y):
+                logger.warning(f"Labels layer shape {plane.shape} does not match image ({X}, {Y})")
+                return None
+            label = plane[x, y]
+            if label == 0:
+                logger.warning(f"No label under ({x}, {y})")
+                return None
+            full_mask = plane == label
+            offset = (0, 0)
+        else:
+            found = shapes_mask_at(roi_layer, x, y, (X, Y))
+            if found is None:
+                logger.warning(f"No shape contains ({x}, {y})")
+                return None
+            (offset_x, _, offset_y, _), full_mask, label = found
+            offset = (offset_x, offset_y)
+        
+        rows = np.flatnonzero(full_mask.any(axis=1))
+        cols = np.flatnonzero(full_mask.any(axis=0))
+        x0, x1, y0, y1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+        roi_key = (mode, id(roi_layer), self.layer_data_version(roi_layer), label)
+        bounds = (offset[0] + x0, offset[0] + x1, offset[1] + y0, offset[1] + y1)
+        return bounds, full_mask[x0:x1, y0:y1], roi_key
+    
+    def pixel_cache_key(self, layer, x, y, wavelet_tuple):
+        """Spectra cache key of one pixel under the current settings."""
+        return (id(layer), self.layer_data_version(layer), x, y,
+                wavelet_key(wavelet_tuple), self.nv)
+    
+    def get_filter_bank(self, wavelet_tuple, n_samples):
+        """Return the persistent CWT filter bank, rebuilding it only if wavelet, nv or T changed."""
+        key = WaveletFilterBank.make_key(wavelet_tuple, self.nv, n_samples)
+        if self.filter_bank is None or self.filter_bank.key != key:
+            self.filter_bank = WaveletFilterBank(wavelet_tuple, self.nv, n_samples)
+        return self.filter_bank
+    
+    def layer_data_version(self, layer):
+        """Counter bumped whenever the layer's data is replaced, used in cache keys."""
+        layer_id = id(layer)
+        if layer_id not in self._layer_versions:
+            self._layer_versions[layer_id] = 0
+            layer.events.data.connect(lambda event, layer_id=layer_id: self._bump_layer_version(layer_id))
+        return self._layer_versions[layer_id]
+    
+    def _bump_layer_version(self, layer_id):
+        self._layer_versions[layer_id] = self._layer_versions.get(layer_id, 0) + 1
+        self.spectra_cache.invalidate_layer(layer_id)
+    
+    def _on_layer_removed(self, event):
+        layer_id = id(event.value)
+        self._layer_versions.pop(layer_id, None)
+        self.spectra_cache.invalidate_layer(layer_id)
+        if self.last_layer is event.value:
+            self.last_layer = None
 
     def closeEvent(self, event):
         """Clean up when widget is closed"""
@@ -881,6 +1410,29 @@ class SpectralWidget(QWidget):
             self.viewer.dims.events.current_step.disconnect(self.update_time_cursor)
         except (ValueError, RuntimeError):
             pass
+        
+        self.set_hover_callback(False)
+        if self.feature_worker is not None:
+            self.feature_worker.quit()
+        self._pending_pixel_request = None
+        if self._pixel_worker is not None:
+            self._pixel_worker.quit()
+        
+        try:
+            self.viewer.layers.events.removed.disconnect(self._on_layer_removed)
+            self.viewer.layers.events.inserted.disconnect(self.update_roi_layer_choices)
+            self.viewer.layers.events.removed.disconnect(self.update_roi_layer_choices)
+        except (ValueError, RuntimeError):
+            pass
+        self.spectra_cache.clear()
+        self.result_store.clear()
+        
+        for f in self._open_files:
+            try:
+                f.close()
+            except Exception:
+                pass
+        self._open_files = []
 
         super().closeEvent(event)
 
@@ -891,10 +1443,15 @@ class SpectralWidget(QWidget):
                 child = QTreeWidgetItem(root_item)
                 child.setText(0, str(k))
                 self.populate_tree(child, v)
-        elif isinstance(data, (torch.Tensor, np.ndarray)):
+        elif is_array_like(data):
             shape_str = "x".join(map(str, data.shape))
             dtype_str = str(data.dtype)
-            type_name = "Tensor" if isinstance(data, torch.Tensor) else "Array"
+            if isinstance(data, torch.Tensor):
+                type_name = "Tensor"
+            elif isinstance(data, np.ndarray):
+                type_name = "Array"
+            else:
+                type_name = f"Lazy {type(data).__name__}"
             root_item.setText(1, f"{type_name} [{shape_str}] ({dtype_str})")
         elif isinstance(data, (int, float, str, list, tuple)):
             root_item.setText(1, str(data))
@@ -920,18 +1477,21 @@ class SpectralWidget(QWidget):
         while root_item.parent() is not None:
             root_item = root_item.parent()
 
-        data = self.results_dict.get(id(root_item))
+        data = self.result_store.get(id(root_item))
         if data is None:
             return
 
         # Traverse the dictionary using the path (skipping path[0] which is the root name)
         val = data
+        keys = []
         for key in path[1:]:
             if isinstance(val, dict):
                 if key in val:
                     val = val[key]
+                    keys.append(key)
                 elif key.isdigit() and int(key) in val:
                     val = val[int(key)]
+                    keys.append(int(key))
                 else:
                     logger.warning(f"Key {key} not found in dictionary data.")
                     return
@@ -939,14 +1499,17 @@ class SpectralWidget(QWidget):
                 logger.warning("Encountered non-dict before leaf was reached.")
                 return
 
-        # Add to canvas if it's a tensor or array
-        if isinstance(val, (torch.Tensor, np.ndarray)):
+        # Add to canvas if it's a tensor or array (zarr/dask arrays stay lazy)
+        if is_array_like(val):
             if isinstance(val, torch.Tensor):
-                val = val.detach().cpu().numpy()
+                val = host_or_device(val)  # GPU-resident results are copied per displayed slice
+            elif isinstance(val, zarr.Array):
+                val = da.from_zarr(val)  # read chunk by chunk as the viewer slices
             
             # Form layer name by joining the path elements
             layer_name = "_".join(path)
-            self.viewer.add_image(val, name=layer_name)
+            self.add_feature_layer(val, name=layer_name,
+                                   metadata={"result_key": id(root_item), "result_path": tuple(keys)})
             logger.info(f"Added {layer_name} to napari canvas.")
         else:
             from qtpy.QtWidgets import QMessageBox
@@ -968,7 +1531,7 @@ class SpectralWidget(QWidget):
         while root_item.parent() is not None:
             root_item = root_item.parent()
 
-        data = self.results_dict.get(id(root_item))
+        data = self.result_store.get(id(root_item))
         if data is None:
             from qtpy.QtWidgets import QMessageBox
             QMessageBox.warning(self, "No Data", "Could not find the data associated with the selected item.")
@@ -987,12 +1550,13 @@ class SpectralWidget(QWidget):
 
         # Write to zarr
         try:
-            try:
-                from cellstream.io import write_to_zarr
-                write_to_zarr(data, file_path)
-            except ImportError:
-                # Fallback to local implementation
-                self.local_write_to_zarr(data, file_path)
+            clevel = self.zarr_clevel_spin.value()
+            self.local_write_to_zarr(
+                data,
+                file_path,
+                chunks=self.zarr_chunks_combo.currentData(),
+                compressor=make_compressor(clevel=clevel) if clevel > 0 else None,
+            )
             
             from qtpy.QtWidgets import QMessageBox
             QMessageBox.information(self, "Save Successful", f"Successfully saved to:\n{file_path}")
@@ -1012,12 +1576,12 @@ class SpectralWidget(QWidget):
             return
 
         try:
-            # Open zarr store
-            store = zarr.DirectoryStore(dir_path)
-            root = zarr.open(store=store, mode="r")
+            # Open zarr store (one read of the consolidated metadata when available)
+            root = open_result_store(dir_path)
+            index = root.attrs.get(INDEX_KEY) if hasattr(root, "attrs") else None
             
-            # Load zarr to dictionary recursively
-            data = self.local_load_zarr_to_dict(root)
+            # Load zarr to dictionary recursively (metadata only; arrays stay on disk)
+            data = self.local_load_zarr_to_dict(root, lazy=True)
             
             # Generate root name based on directory name
             import os
@@ -1031,13 +1595,15 @@ class SpectralWidget(QWidget):
             root_item = QTreeWidgetItem(self.results_tree)
             root_item.setText(0, root_name)
             
-            if isinstance(data, dict):
+            if index is not None:
+                root_item.setText(1, describe_result_index(index))
+            elif isinstance(data, dict):
                 root_item.setText(1, f"Dict ({len(data)} keys)")
             else:
                 root_item.setText(1, f"Zarr Array")
                 
             self.populate_tree(root_item, data)
-            self.results_dict[id(root_item)] = data
+            self.result_store.add(id(root_item), data)
             
             from qtpy.QtWidgets import QMessageBox
             QMessageBox.information(self, "Load Successful", f"Successfully loaded Zarr store from:\n{dir_path}")
@@ -1047,65 +1613,77 @@ class SpectralWidget(QWidget):
             from qtpy.QtWidgets import QMessageBox
             QMessageBox.critical(self, "Load Failed", f"Failed to load Zarr store:\n{str(e)}")
 
-    def local_write_to_zarr(self, data, path, chunks=True, compressor="default"):
-        """Fallback local implementation of write_to_zarr."""
-        if compressor == "default":
-            compressor = zarr.Blosc(cname="zstd", clevel=5, shuffle=zarr.Blosc.BITSHUFFLE)
-
-        if isinstance(data, (torch.Tensor, np.ndarray)):
-            if isinstance(data, torch.Tensor):
-                data = data.detach().cpu().numpy()
-            z = zarr.open(path, mode="w", shape=data.shape, dtype=data.dtype, 
-                          chunks=chunks, compressor=compressor)
-            z[:] = data
-        elif isinstance(data, dict):
-            store = zarr.DirectoryStore(path)
-            root = zarr.group(store=store, overwrite=True)
-            self.local_write_dict_to_zarr_group(root, data, chunks=chunks, compressor=compressor)
-        else:
-            raise TypeError(f"Unsupported data type for write_to_zarr: {type(data)}")
-
-    def local_write_dict_to_zarr_group(self, group, d, chunks=True, compressor=None):
+    def _result_layer_data(self, result, metadata):
+        """Array backing a result layer, rebuilt from the stored result."""
+        if metadata.get("source") == "cwt" and "feature" in metadata:
+            return stack_channels(result, axis=1).get(metadata["feature"])
+        val = resolve_result_path(result, metadata.get("result_path", ()))
+        if isinstance(val, zarr.Array):
+            val = da.from_zarr(val)
+        elif isinstance(val, torch.Tensor):
+            val = host_or_device(val)
+        return val
+
+    def _on_result_budget_changed(self):
+        self.result_store.set_budget(int(self.result_budget_spin.value() * 1024**3))
+        self.spill_over_budget()
+
+    def spill_over_budget(self, keep=()):
+        """Spill the least recently used results beyond the RAM budget to the Zarr cache in a worker thread.
+        
+        Results in `keep` (the one just added) stay resident even when they alone exceed the budget.
+        """
+        spills = [self.result_store.begin_spill(key) for key in self.result_store.over_budget(keep=keep)]
+        if not spills:
+            return
+        worker = result_spill_worker(self.result_store, spills)
+        worker.yielded.connect(lambda spill: self.result_store.finish_spill(*spill))
+        worker.errored.connect(lambda e: logger.error(f"Spilling results to the Zarr cache failed: {e}"))
+        # spills that did not finish (errors) become candidates again
+        worker.finished.connect(lambda: [self.result_store.cancel_spill(key) for key, _, _ in spills])
+        worker.start()
+
+    def _result_layers(self, key):
+        return [layer for layer in self.viewer.layers
+                if layer.metadata.get("result_key") == key]
+
+    def _on_result_spilled(self, key, result):
+        """Re-point the layers of a spilled result at its Zarr cache so the in-memory arrays are freed."""
+        for layer in self._result_layers(key):
+            data = self._result_layer_data(result, layer.metadata)
+            if data is None:
+                logger.warning(f"Layer {layer.name} not found in spilled result {key}; it keeps its in-memory data")
+                continue
+            layer.data = build_pyramid(data) if layer.multiscale else data
+        for i in range(self.results_tree.topLevelItemCount()):
+            item = self.results_tree.topLevelItem(i)
+            if id(item) == key:
+                item.takeChildren()
+                self.populate_tree(item, result)
+                item.setText(1, f"{item.text(1)} (spilled to disk)")
+
+    def release_selected_result(self):
+        """Remove the selected result from the tree, the viewer and the result store."""
+        root_item = self.results_tree.currentItem()
+        if root_item is None:
+            return
+        while root_item.parent() is not None:
+            root_item = root_item.parent()
+        key = id(root_item)
+        for layer in self._result_layers(key):
+            self.viewer.layers.remove(layer)
+        self.result_store.release(key)
+        self.results_tree.takeTopLevelItem(self.results_tree.indexOfTopLevelItem(root_item))
+        logger.info(f"Released {root_item.text(0)}")
+
+    def local_write_to_zarr(self, data, path, chunks="spatial", compressor="default", **kwargs):
+        """Local implementation of write_to_zarr (chunked, threaded; see _io.write_to_zarr)."""
+        write_to_zarr(data, path, chunks=chunks, compressor=compressor, **kwargs)
+
+    def local_write_dict_to_zarr_group(self, group, d, chunks="spatial", compressor=None, **kwargs):
         """Fallback local implementation of write dict to zarr group."""
-        for k, v in d.items():
-            key = str(k)
-            if isinstance(v, dict):
-                subgroup = group.create_group(key)
-                self.local_write_dict_to_zarr_group(subgroup, v, chunks=chunks, compressor=compressor)
-            elif isinstance(v, (torch.Tensor, np.ndarray)):
-                if isinstance(v, torch.Tensor):
-                    v = v.detach().cpu().numpy()
-                group.array(key, v, chunks=chunks, compressor=compressor)
-            elif isinstance(v, (int, float, str, list, tuple)):
-                group.attrs[key] = v
-            else:
-                try:
-                    arr = np.array(v)
-                    group.array(key, arr, chunks=chunks, compressor=compressor)
-                except Exception:
-                    print(f"Warning: Could not save key {key} of type {type(v)} to Zarr.")
+        write_dict_to_zarr_group(group, d, chunks=chunks, compressor=compressor, **kwargs)
 
-    def local_load_zarr_to_dict(self, zarr_item):
+    def local_load_zarr_to_dict(self, zarr_item, lazy=True):
         """Recursively loads a Zarr group or array into standard nested Python dictionaries/arrays."""
-        if hasattr(zarr_item, "items"):
-            d = {}
-            for name, child in zarr_item.items():
-                # Protect against pulling virtual keys if the item is a custom wrapper
-                if name == "_attrs":
-                    continue
-                d[name] = self.local_load_zarr_to_dict(child)
-            
-            # Group all attributes into a single nested dictionary
-            if hasattr(zarr_item, "attrs") and len(zarr_item.attrs) > 0:
-                d["_attrs"] = {}
-                for attr_key, attr_val in zarr_item.attrs.items():
-                    d["_attrs"][attr_key] = attr_val
-                    
-            return d
-            
-        elif hasattr(zarr_item, "shape") and hasattr(zarr_item, "dtype"):
-            # Ensure we wrap the read safely across versions
-            return np.asarray(zarr_item[:])
-        else:
-            return zarr_item
-
+        return load_zarr_to_dict(zarr_item, lazy=lazy)
@@ -0,0 +1,60 @@
+import numpy as np
+import torch
+
+from napari_cellstream._io import (INDEX_KEY, feature_chunks, load_zarr_to_dict,
+                                   open_result_store, write_to_zarr)
+
+
+def make_result():
+    rng = np.random.default_rng(0)
+    return {
+        "0": {"amp": torch.from_numpy(rng.random((6, 2, 40, 30), dtype=np.float32)),
+              "z_score": rng.random((6, 2, 40, 30)).astype(np.float32)},
+        "1": {"amp": torch.from_numpy(rng.random((6, 2, 40, 30), dtype=np.float32))},
+        "_attrs": {"wavelet": ("gmw", {"gamma": 3}), "nv": 32, "layout": "table",
+                   "translate": [0, 12, 7], "time_range": [5, 11]},
+    }
+
+
+def test_result_round_trip_keeps_arrays_and_attrs(tmp_path):
+    result = make_result()
+    path = tmp_path / "result.zarr"
+    write_to_zarr(result, path, chunks="spatial", tile_size=16)
+
+    root = open_result_store(path)
+    loaded = load_zarr_to_dict(root, lazy=False)
+
+    assert loaded["_attrs"] == {"wavelet": ["gmw", {"gamma": 3}], "nv": 32, "layout": "table",
+                                "translate": [0, 12, 7], "time_range": [5, 11]}
+    np.testing.assert_array_equal(loaded["0"]["amp"], result["0"]["amp"].numpy())
+    np.testing.assert_array_equal(loaded["0"]["z_score"], result["0"]["z_score"])
+    np.testing.assert_array_equal(loaded["1"]["amp"], result["1"]["amp"].numpy())
+    assert "_attrs" not in loaded["0"]
+
+
+def test_result_store_index_summarizes_features_and_params(tmp_path):
+    path = tmp_path / "result.zarr"
+    write_to_zarr(make_result(), path)
+
+    index = open_result_store(path).attrs[INDEX_KEY]
+    assert index["channels"] == 2
+    assert index["params"] == {"wavelet": ["gmw", {"gamma": 3}], "nv": 32}
+    assert index["features"]["0/amp"] == {"shape": [6, 2, 40, 30], "dtype": "float32"}
+    # the index is not handed back as a job parameter
+    assert INDEX_KEY not in load_zarr_to_dict(open_result_store(path))["_attrs"]
+
+
+def test_lazy_load_returns_zarr_handles(tmp_path):
+    path = tmp_path / "result.zarr"
+    write_to_zarr(make_result(), path)
+    loaded = load_zarr_to_dict(open_result_store(path), lazy=True)
+    assert not isinstance(loaded["0"]["amp"], np.ndarray)
+    assert loaded["0"]["amp"].shape == (6, 2, 40, 30)
+
+
+def test_feature_chunks_layouts():
+    assert feature_chunks((100, 2, 1000, 1000), 4, layout="spatial") == (100, 1, 256, 256)
+    assert feature_chunks((100, 2, 1000, 1000), 4, layout="pixel", pixel_block=8) == (100, 1, 8, 8)
+    chunks = feature_chunks((1000, 4, 4096, 4096), 4, max_chunk_bytes=64 * 1024**2)
+    assert chunks == (1000, 1, 128, 128)
+    assert np.prod(chunks) * 4 <= 64 * 1024**2
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+import torch
+import zarr
+
+from napari_cellstream._normalize import feature_stats, normalization_transform, normalize_features
+from napari_cellstream._tiling import run_blockwise, run_to_completion
+
+
+def amplitude(slab):
+    t = torch.as_tensor(np.asarray(slab, dtype=np.float32))
+    return {0: {"amp": t.abs().mean(dim=0), "phase": t[0]}, "_attrs": {}}
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(2)
+    return rng.standard_normal((8, 2, 19, 12)).astype(np.float32)
+
+
+@pytest.mark.parametrize("options", [
+    dict(normalize_histogram=True),
+    dict(mean_center=True, normalize_amplitudes=True),
+    dict(mean_center=True, normalize_amplitudes=True, normalize_histogram=True),
+])
+def test_normalization_does_not_depend_on_blocks(data, options):
+    results = []
+    for n_blocks in (1, 5):
+        out = run_to_completion(run_blockwise(amplitude, data, n_blocks))
+        normalize_features(out, ("amp",), n_slabs=3, **options)
+        results.append(out)
+    np.testing.assert_allclose(results[0][0]["amp"], results[1][0]["amp"], rtol=1e-5, atol=1e-6)
+
+    amp = np.abs(data).mean(axis=0)
+    if options.get("mean_center"):
+        amp = amp - amp.mean()
+    if options.get("normalize_amplitudes"):
+        amp = amp / np.abs(amp).max()
+    if options.get("normalize_histogram"):
+        amp = (amp - amp.min()) / (amp.max() - amp.min())
+    np.testing.assert_allclose(results[1][0]["amp"], amp, rtol=1e-5, atol=1e-6)
+    # other features are left as computed
+    np.testing.assert_array_equal(results[1][0]["phase"], data[0])
+
+
+def test_normalization_after_process_pool(data):
+    sequential = run_to_completion(run_blockwise(amplitude, data, 4))
+    parallel = run_to_completion(run_blockwise(amplitude, data, 4, workers=2))
+    for out in (sequential, parallel):
+        normalize_features(out, ("amp",), mean_center=True, normalize_histogram=True)
+    np.testing.assert_allclose(parallel[0]["amp"], sequential[0]["amp"], rtol=1e-5, atol=1e-6)
+
+
+def test_normalization_skips_background(data):
+    mask = np.zeros(data.shape[-2:], dtype=bool)
+    mask[4:11, 2:9] = True
+    out = run_to_completion(run_blockwise(amplitude, data, 4, mask=mask))
+    normalize_features(out, ("amp",), mask=mask, normalize_histogram=True)
+    amp = out[0]["amp"].numpy()
+    assert amp[..., mask].min() == pytest.approx(0, abs=1e-6) and amp[..., mask].max() == pytest.approx(1)
+    assert (amp[..., ~mask] == 0).all()
+
+
+def test_normalization_of_zarr_arrays(data, tmp_path):
+    amp = np.abs(data).mean(axis=0)
+    arr = zarr.open(str(tmp_path / "amp.zarr"), mode="w", shape=amp.shape, chunks=(1, 8, 8), dtype=amp.dtype)
+    arr[:] = amp
+    assert feature_stats(arr, n_slabs=4) == pytest.approx((amp.min(), amp.max(), amp.mean()))
+    normalize_features({"amp": arr}, ("amp",), n_slabs=4, normalize_histogram=True)
+    np.testing.assert_allclose(arr[:], (amp - amp.min()) / (amp.max() - amp.min()), rtol=1e-5, atol=1e-6)
+
+
+def test_constant_features_are_left_unscaled():
+    assert normalization_transform((2.0, 2.0, 2.0), normalize_histogram=True) == (1.0, 0.0)
+    assert normalization_transform(None, mean_center=True) == (1.0, 0.0)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from ssqueezepy import cwt
+
+from napari_cellstream._pixel_spectra import WaveletFilterBank, read_roi_traces
+
+# wavelets offered by the pixel inspector (spectral_analyzer.WAVELET_PARAMS)
+WAVELETS = [
+    ("gmw", {}),
+    ("gmw", {"gamma": 3, "beta": 60}),
+    ("morlet", {"mu": 13.4}),
+    ("bump", {"mu": 5, "s": 1, "om": 0}),
+]
+
+
+@pytest.mark.parametrize("wavelet", WAVELETS, ids=lambda w: f"{w[0]}{w[1]}")
+@pytest.mark.parametrize("n_samples", [257, 500])
+def test_filter_bank_matches_ssqueezepy_cwt(wavelet, n_samples):
+    rng = np.random.default_rng(0)
+    t = np.arange(n_samples)
+    x = np.sin(2 * np.pi * t / 23) + 0.5 * np.sin(2 * np.pi * t / 71) + 0.2 * rng.standard_normal(n_samples)
+    x = x - x.mean()
+
+    bank = WaveletFilterBank(wavelet, nv=32, n_samples=n_samples)
+    Wx, scales = cwt(x, wavelet, nv=32)
+
+    Wx_bank = bank.transform(x)
+    assert Wx_bank.shape == Wx.shape
+    np.testing.assert_allclose(bank.scales.ravel(), np.asarray(scales).ravel(), rtol=1e-6)
+    assert np.abs(Wx_bank - Wx).max() / np.abs(Wx).max() < 1e-5
+
+
+def test_filter_bank_transform_batches_channels():
+    rng = np.random.default_rng(1)
+    traces = rng.standard_normal((3, 128))
+    traces -= traces.mean(axis=-1, keepdims=True)
+    bank = WaveletFilterBank(("gmw", {}), nv=16, n_samples=128)
+
+    batched = bank.transform(traces)
+    for c in range(3):
+        np.testing.assert_allclose(batched[c], bank.transform(traces[c]), rtol=1e-10, atol=1e-12)
+
+
+@pytest.mark.parametrize("average", [None, "trace"])
+def test_read_roi_traces_in_row_chunks(average):
+    rng = np.random.default_rng(3)
+    data = rng.integers(0, 4096, size=(40, 2, 30, 20)).astype(np.uint16)
+    bounds = (5, 22, 3, 15)
+    mask = rng.random((17, 12)) > 0.4
+    slab = data[:, :, 5:22, 3:15].astype(np.float64)[:, :, mask]  # (T, C, N)
+    expected = slab.transpose(1, 2, 0) - slab.transpose(1, 2, 0).mean(axis=-1, keepdims=True)
+    if average == "trace":
+        expected = expected.mean(axis=1, keepdims=True)
+
+    # chunk_bytes small enough to read a couple of rows at a time
+    traces = read_roi_traces(data, bounds, mask, average=average, chunk_bytes=40 * 2 * 12 * 4 * 2)
+    assert traces.dtype == np.float32 and traces.shape == expected.shape
+    np.testing.assert_allclose(traces, expected, rtol=1e-4, atol=1e-2)
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from napari_cellstream._regions import FeatureRegion, mask_bounds, shapes_mask_at
+
+
+def test_region_crop_and_attrs():
+    data = np.arange(20 * 2 * 30 * 40).reshape(20, 2, 30, 40)
+    roi = np.zeros((30, 40), dtype=bool)
+    roi[5:12, 8:20] = True
+    region = FeatureRegion(data.shape, time_start=4, time_stop=15, roi_mask=roi)
+
+    assert mask_bounds(roi) == (5, 12, 8, 20)
+    assert region.cropped_shape(data.shape) == (11, 2, 7, 12)
+    np.testing.assert_array_equal(region.crop(data), data[4:15, :, 5:12, 8:20])
+    assert region.mask.shape == (7, 12) and region.mask.all()
+
+    attrs = region.attrs(scale=0.5)
+    assert attrs["time_range"] == [4, 15]
+    assert attrs["time_offset"] == 4
+    assert attrs["translate"] == [2.5, 4.0]
+
+
+def test_region_rejects_empty_mask_and_bad_window():
+    with pytest.raises(ValueError):
+        FeatureRegion((10, 1, 8, 8), roi_mask=np.zeros((8, 8), dtype=bool))
+    with pytest.raises(ValueError):
+        FeatureRegion((10, 1, 8, 8), time_start=5, time_stop=3)
+
+
+class _Rectangle:
+    """Stand-in for a napari rectangle Shape (to_mask over a window given by its offset)."""
+
+    def __init__(self, x0, x1, y0, y1):
+        self.bounds = (x0, x1, y0, y1)
+
+    def to_mask(self, mask_shape, offset=(0, 0)):
+        rows = np.arange(mask_shape[0])[:, None] + offset[0]
+        cols = np.arange(mask_shape[1])[None, :] + offset[1]
+        x0, x1, y0, y1 = self.bounds
+        return (rows >= x0) & (rows < x1) & (cols >= y0) & (cols < y1)
+
+
+class _ShapesLayer:
+    def __init__(self, rects):
+        self.data = [np.array([[x0, y0], [x1 - 1, y0], [x1 - 1, y1 - 1], [x0, y1 - 1]], float)
+                     for x0, x1, y0, y1 in rects]
+        self._data_view = type("ShapeList", (), {"shapes": [_Rectangle(*r) for r in rects]})()
+
+
+def test_shapes_mask_at_rasterizes_only_shapes_under_the_pixel():
+    layer = _ShapesLayer([(2, 6, 2, 6), (4, 10, 5, 8), (20, 25, 20, 25)])
+    bounds, mask, hits = shapes_mask_at(layer, 5, 5, (30, 30))
+    assert hits == (0, 1) and bounds == (2, 10, 2, 8)
+    expected = np.zeros((30, 30), bool)
+    expected[2:6, 2:6] = expected[4:10, 5:8] = True
+    np.testing.assert_array_equal(mask, expected[2:10, 2:8])
+    assert shapes_mask_at(layer, 15, 15, (30, 30)) is None
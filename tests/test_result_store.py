@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import torch
+
+from napari_cellstream._result_store import ResultStore, resident_bytes, resolve_result_path
+
+
+def make_result(seed, n=64):
+    rng = np.random.default_rng(seed)
+    return {
+        "0": {"amp": torch.from_numpy(rng.random((4, n, n), dtype=np.float32))},
+        "pixel_coords": np.arange(10, dtype=np.int32).reshape(5, 2),
+        "_attrs": {"layout": "table", "translate": [3, 4]},
+    }
+
+
+def test_add_shares_cpu_tensor_memory():
+    store = ResultStore()
+    result = make_result(0)
+    stored = store.add("a", result)
+    assert isinstance(stored["0"]["amp"], np.ndarray)
+    assert np.shares_memory(stored["0"]["amp"], result["0"]["amp"].numpy())
+    assert store.nbytes == 4 * 64 * 64 * 4 + 10 * 4
+
+
+def test_device_tensors_do_not_count_against_the_ram_budget():
+    # a "meta" tensor stands in for a GPU-resident one (no data, non-CPU device)
+    on_device = torch.empty((4, 64, 64), dtype=torch.float32, device="meta")
+    result = {"0": {"amp": on_device, "freq": np.zeros((64, 64), dtype=np.float32)}}
+    assert resident_bytes(result) == 64 * 64 * 4
+    assert resident_bytes(result, on_device=True) == 4 * 64 * 64 * 4
+
+    store = ResultStore(max_bytes=0)
+    store.add("a", result)
+    assert store.nbytes == 64 * 64 * 4 and store.device_nbytes == 4 * 64 * 64 * 4
+    store.release("a")
+    assert store.nbytes == 0 and store.device_nbytes == 0
+
+
+def test_newest_result_is_kept_and_lru_is_spilled(tmp_path):
+    spilled = []
+    store = ResultStore(max_bytes=100_000, cache_dir=str(tmp_path),
+                        on_spill=lambda key, result: spilled.append(key))
+    expected = make_result(0)["0"]["amp"].numpy()
+    store.add("a", make_result(0))
+    # a single result over the budget is not spilled while it is the newest one
+    assert store.over_budget(keep=("a",)) == []
+
+    store.add("b", make_result(1))
+    store.evict(keep=("b",))
+    assert spilled == ["a"]
+    assert store.is_spilled("a") and not store.is_spilled("b")
+
+    a = store.get("a")
+    assert a["_attrs"] == {"layout": "table", "translate": [3, 4]}
+    np.testing.assert_array_equal(a["0"]["amp"][:], expected)
+    np.testing.assert_array_equal(a["pixel_coords"][:], np.arange(10).reshape(5, 2))
+
+
+def test_finish_spill_drops_cache_of_released_result(tmp_path):
+    store = ResultStore(max_bytes=0, cache_dir=str(tmp_path))
+    store.add("a", make_result(0))
+    spill = store.write_cache(*store.begin_spill("a"))
+    store.release("a")
+    store.finish_spill(*spill)
+    assert "a" not in store
+    assert not os.path.exists(spill[2])
+
+
+def test_release_removes_cache(tmp_path):
+    store = ResultStore(max_bytes=0, cache_dir=str(tmp_path))
+    store.add("a", make_result(0))
+    store.spill("a")
+    path = store._spilled["a"]
+    assert os.path.isdir(path)
+    store.release("a")
+    assert not os.path.exists(path) and len(store) == 0
+
+
+def test_layer_paths_with_int_channel_keys_resolve_after_spill(tmp_path):
+    store = ResultStore(max_bytes=0, cache_dir=str(tmp_path))
+    amp = np.arange(2 * 8 * 8, dtype=np.float32).reshape(2, 8, 8)
+    stored = store.add("a", {0: {"amp": amp}, 1: {"amp": amp + 1}, "_attrs": {}})
+    assert resolve_result_path(stored, (1, "amp")) is stored[1]["amp"]
+
+    store.spill("a")
+    assert store.nbytes == 0
+    spilled = store.get("a")
+    np.testing.assert_array_equal(resolve_result_path(spilled, (0, "amp"))[:], amp)
+    np.testing.assert_array_equal(resolve_result_path(spilled, (1, "amp"))[:], amp + 1)
+    assert resolve_result_path(spilled, (2, "amp")) is None
@@ -0,0 +1,85 @@
+from functools import partial
+
+import numpy as np
+import pytest
+import torch
+
+from napari_cellstream._tiling import (block_tiles, gather_pixels, run_blockwise, run_to_completion,
+                                      scatter_pixels)
+
+
+def block_features(slab, scale=1.0):
+    """Per-pixel features of a (T, C, x, y) slab plus a non-spatial attribute."""
+    t = torch.as_tensor(np.asarray(slab, dtype=np.float32))
+    return {
+        "mean": t.mean(dim=0) * scale,
+        "nested": {"power": (t ** 2).sum(dim=0).numpy()},
+        "_attrs": {"scale": scale},
+    }
+
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((6, 2, 21, 13)).astype(np.float32)
+
+
+def _check(out, data, mask=None):
+    mean = data.mean(axis=0)
+    power = (data ** 2).sum(axis=0)
+    if mask is not None:
+        mean, power = mean * mask, power * mask
+    np.testing.assert_allclose(np.asarray(out["mean"]), mean, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(out["nested"]["power"], power, rtol=1e-5, atol=1e-5)
+    assert out["_attrs"] == {"scale": 1.0}
+
+
+@pytest.mark.parametrize("n_blocks", [1, 4, 21])
+def test_run_blockwise_stitches_slabs(data, n_blocks):
+    job = run_blockwise(block_features, data, n_blocks)
+    steps = []
+    while True:
+        try:
+            steps.append(next(job))
+        except StopIteration as stop:
+            out = stop.value
+            break
+    assert [s["done"] for s in steps] == list(range(1, n_blocks + 1))
+    assert out["mean"].device.type == "cpu"
+    _check(out, data)
+
+
+def test_run_blockwise_masked(data):
+    mask = np.zeros(data.shape[-2:], dtype=bool)
+    mask[3:9, 2:7] = True
+    mask[15, 10] = True
+    # slabs that hold no foreground are skipped
+    assert len(block_tiles(data.shape, 7, mask)) < 7
+    out = run_to_completion(run_blockwise(block_features, data, 7, mask=mask))
+    _check(out, data, mask)
+
+    with pytest.raises(ValueError):
+        run_to_completion(run_blockwise(block_features, data, 3, mask=np.zeros_like(mask)))
+
+
+def test_run_blockwise_parallel_matches_sequential(data):
+    fn = partial(block_features, scale=1.0)
+    out = run_to_completion(run_blockwise(fn, data, 5, workers=2))
+    _check(out, data)
+
+
+
+def test_gather_scatter_round_trip(data):
+    mask = np.zeros(data.shape[-2:], dtype=bool)
+    mask[2:6, 3:8] = True
+    mask[12, 0] = mask[20, 12] = True
+
+    pixels, coords = gather_pixels(data, mask, n_slabs=4)
+    assert pixels.shape == data.shape[:-2] + (mask.sum(),)
+    np.testing.assert_array_equal(pixels, data[..., mask])
+    np.testing.assert_array_equal(coords, np.argwhere(mask))
+
+    table = {"values": torch.from_numpy(pixels[..., np.newaxis]), "_attrs": {"n": len(coords)}}
+    out = scatter_pixels(table, coords, mask.shape)
+    np.testing.assert_array_equal(out["values"], np.where(mask, data, 0))
+    assert out["_attrs"] == {"n": len(coords)}
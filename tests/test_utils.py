@@ -0,0 +1,49 @@
+import numpy as np
+import torch
+
+from napari_cellstream._utils import DeviceArray, as_float32_tensor
+
+
+def test_device_array_single_tensor():
+    t = torch.arange(4 * 5 * 6, dtype=torch.float32).reshape(4, 5, 6)
+    ref = t.numpy()
+    arr = DeviceArray(t)
+
+    assert arr.shape == (4, 5, 6) and arr.ndim == 3 and len(arr) == 4
+    assert arr.dtype == np.float32 and arr.nbytes == ref.nbytes
+    np.testing.assert_array_equal(arr[1], ref[1])
+    np.testing.assert_array_equal(arr[..., 2:4], ref[..., 2:4])
+    np.testing.assert_array_equal(arr.downsampled(2)[:], ref[:, ::2, ::2])
+
+
+def test_device_array_stacked_matches_numpy_stack():
+    tensors = [torch.randn(3, 8, 10) for _ in range(4)]
+    ref = np.stack([t.numpy() for t in tensors], axis=1)  # (3, 4, 8, 10)
+    arr = DeviceArray(tensors, axis=1)
+
+    assert arr.shape == ref.shape and arr.nbytes == ref.nbytes
+    for index in [
+        0,
+        (slice(None), 2),
+        (1, slice(1, 3)),
+        (Ellipsis, slice(2, 5), 3),
+        (slice(None), slice(None), 4),
+        (2, Ellipsis),
+        Ellipsis,
+    ]:
+        np.testing.assert_array_equal(arr[index], ref[index])
+    np.testing.assert_array_equal(arr.downsampled(3)[:], ref[..., ::3, ::3])
+    assert isinstance(arr.on_device((0, slice(None))), torch.Tensor)
+
+
+def test_as_float32_tensor_copies_read_only_arrays(tmp_path):
+    writable = np.arange(12, dtype=np.float32).reshape(3, 4)
+    assert np.shares_memory(as_float32_tensor(writable).numpy(), writable)
+
+    path = tmp_path / "frames.dat"
+    np.memmap(path, mode="w+", dtype=np.float32, shape=(3, 4))[:] = writable
+    read_only = np.memmap(path, mode="r", dtype=np.float32, shape=(3, 4))
+    t = as_float32_tensor(read_only)
+    assert not np.shares_memory(t.numpy(), read_only)
+    t += 1  # in-place ops on the tensor leave the mapping alone
+    np.testing.assert_array_equal(read_only, writable)